@@ -0,0 +1,68 @@
+#
+#      Copyright (C) 2014 Tommy Winther, msj33, TermeHansen
+#
+#  https://github.com/xbmc-danish-addons/plugin.video.drnu
+#
+#  This Program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2, or (at your option)
+#  any later version.
+#
+#  This Program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this Program; see the file LICENSE.txt.  If not, write to
+#  the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
+#  http://www.gnu.org/copyleft/gpl.html
+#
+# Compares decrypt_uri against the int list aes_cbc_decrypt it replaced, on EncryptedUri payloads
+# shaped like the ones in the asset manifests.
+#
+#   python benchmarks/bench_decrypt.py
+#
+import hashlib
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from resources.lib import tvapi  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'encrypted_uris.json')
+
+
+def decrypt_uri_intlist(e):
+    # decrypt_uri as it was before the table driven aes
+    n = int(e[2:10], 16)
+    a = e[10 + n:]
+    data = tvapi.bytes_to_intlist(tvapi.hex_to_bytes(e[10:10 + n]))
+    key = tvapi.bytes_to_intlist(hashlib.sha256(
+        ('%s:sRBzYNXBzkKgnjj8pGtkACch' % a).encode('utf-8')).digest())
+    iv = tvapi.bytes_to_intlist(tvapi.hex_to_bytes(a))
+    decrypted = tvapi.aes_cbc_decrypt(data, key, iv)
+    return tvapi.intlist_to_bytes(
+        decrypted[:-decrypted[-1]]).decode('utf-8').split('?')[0]
+
+
+def main(number=200):
+    with open(FIXTURES) as fh:
+        fixtures = json.load(fh)
+
+    for fixture in fixtures:
+        assert tvapi.decrypt_uri(fixture['EncryptedUri']) == fixture['Uri']
+        assert decrypt_uri_intlist(fixture['EncryptedUri']) == fixture['Uri']
+
+    for fixture in fixtures:
+        e = fixture['EncryptedUri']
+        old = min(timeit.repeat(lambda: decrypt_uri_intlist(e), number=number, repeat=3)) / number
+        new = min(timeit.repeat(lambda: tvapi.decrypt_uri(e), number=number, repeat=3)) / number
+        print('{:5d} bytes  intlist {:8.3f} ms  tables {:8.3f} ms  {:5.1f}x'.format(
+            (int(e[2:10], 16)) // 2, old * 1000, new * 1000, old / new))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+#
+#      Copyright (C) 2014 Tommy Winther, msj33, TermeHansen
+#
+#  https://github.com/xbmc-danish-addons/plugin.video.drnu
+#
+#  This Program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2, or (at your option)
+#  any later version.
+#
+#  This Program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this Program; see the file LICENSE.txt.  If not, write to
+#  the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
+#  http://www.gnu.org/copyleft/gpl.html
+#
+#
+# Times the hot paths of the addon outside kodi, with the kodi stubs and the api fixtures:
+# the listings at several sizes, paging, decryption, subtitle conversion, date parsing,
+# and whole route() calls against the local fixture server, once cold and then with warm caches.
+#
+#   python benchmarks/bench_hotpaths.py [--sizes 100,1000,10000] [--repeat 5] [--json] [--output results.json]
+#   python benchmarks/bench_hotpaths.py --compare before.json
+#   python benchmarks/bench_hotpaths.py --latency 0.05 --jitter 0.05 --error-rate 0.02 --page-size 20
+#
+# The server options are those of fixture_server.py, for seeing the routes against a slow or failing api.
+#
+# The json holds the median ms per benchmark, so results of two releases can be compared with --compare.
+#
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import sys
+import tempfile
+import time
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(BENCHMARKS, '..')
+sys.path[:0] = [ROOT, BENCHMARKS]
+import kodi_stubs  # noqa: E402
+from fixture_server import FixtureApi, FixtureServer  # noqa: E402
+
+PLUGIN_URL = 'plugin://plugin.video.drnu/'
+ROUTES = (
+    ('main menu', ''),
+    ('A-Z', '?show=listAZ'),
+    ('A-Z letter', '?listProgramSeriesByLetter=a'),
+    ('latest', '?show=latest'),
+    ('most viewed', '?show=mostViewed'),
+    ('highlights', '?show=highlights'),
+    ('themes', '?show=themes'),
+    ('theme', '?listThemeSeries=dokumentar'),
+    ('series', '?listVideos=bonderoeven-tv'),
+    ('favorites', '?show=favorites'),
+    ('play', '?playVideo=bonderoeven-tv-3'),
+    ('recently watched', '?show=recentlyWatched'),
+    ('live tv', '?playLiveTV=dr1'),
+    ('diagnostics', '?show=diagnostics'),
+)
+
+
+def timed(func, repeat):
+    """ :returns: median seconds of repeat calls of func """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+        del kodi_stubs.events[:]
+    return statistics.median(times)
+
+
+def result(name, seconds, n=None, **extra):
+    entry = {'name': name, 'median_ms': seconds * 1000}
+    if n:
+        entry['n'] = n
+        entry['per_item_us'] = seconds / n * 1e6
+    entry.update(extra)
+    return entry
+
+
+def bench_listings(addon, fixtures, sizes, repeat):
+    handle = addon.DrDkTvAddon(PLUGIN_URL, 1)
+    for n in sizes:
+        series = fixtures.series('a', n)
+        yield result('listSeries', timed(lambda: handle.listSeries(series), repeat), n)
+        episodes = fixtures.items('bonderoeven-tv', n)
+        yield result('listEpisodes', timed(lambda: handle.listEpisodes(episodes), repeat), n)
+
+
+def bench_paging(tvapi, fixtures, api_url, profile, sizes, repeat):
+    # the pages are answered from memory, this is the cost of the paging itself
+    api = tvapi.Api(profile, str, api_url=api_url)
+    for n in sizes:
+        url = '{}/list/paged-{:d}?limit=75'.format(api_url, n)
+        pages = {}
+        page = fixtures.respond(url)
+        while True:
+            body = json.loads(page[2])
+            pages[url] = body
+            if 'Next' not in body['Paging']:
+                break
+            url = body['Paging']['Next']
+            page = fixtures.respond(url)
+        first = json.dumps(next(iter(pages.values())))
+        api._http_request = pages.__getitem__
+        yield result('_handle_paging', timed(lambda: api._handle_paging(json.loads(first)), repeat), n,
+                     pages=len(pages))
+
+
+def bench_decrypt(tvapi, repeat):
+    with open(os.path.join(BENCHMARKS, 'fixtures', 'encrypted_uris.json')) as fh:
+        fixtures = json.load(fh)
+    encrypted = [fixture['EncryptedUri'] for fixture in fixtures]
+    yield result('decrypt_uri', timed(lambda: [tvapi.decrypt_uri(e) for e in encrypted], repeat), len(encrypted))
+
+
+def bench_vtt2srt(tvapi, profile, repeat):
+    api = tvapi.Api(profile, str)
+    with open(os.path.join(BENCHMARKS, 'fixtures', 'subtitles', 'feature.vtt'), encoding='utf-8') as fh:
+        vtt = fh.read()
+    cues = vtt.count(' --> ')
+    yield result('vtt2srt', timed(lambda: api.vtt2srt(vtt), repeat), cues, bytes=len(vtt.encode('utf-8')))
+
+
+def bench_parse_date(addon, fixtures, sizes, repeat):
+    handle = addon.DrDkTvAddon(PLUGIN_URL, 1)
+    for n in sizes:
+        dates = [item['PrimaryBroadcastStartTime'] for item in fixtures.items('dates', n)]
+        yield result('parseDate', timed(lambda: [handle.parseDate(date) for date in dates], repeat), n)
+
+
+def bench_routes(addon, repeat):
+    # so the favorites have something to list
+    addon.DrDkTvAddon(PLUGIN_URL, 1).store.add_favorite('Bonderoeven Tv')
+    for name, query in ROUTES:
+        failures = []
+        answers = []
+
+        def route():
+            start = time.perf_counter()
+            addon.DrDkTvAddon(PLUGIN_URL, 1).route(query)
+            # until kodi has the listing, the stream or a dialog, the rest is deferred work
+            answers.append(min(t for event, t, _ in kodi_stubs.events
+                               if event in ('endOfDirectory', 'setResolvedUrl', 'dialog')) - start)
+            # the line route() logs ends with what failed
+            failures.extend(args[0] for event, _, args in kodi_stubs.events
+                            if event == 'log' and args[0].startswith('drnu route') and 'failed' in args[0])
+
+        # the first call fills the caches, like the first click on a screen
+        cold = timed(route, 1)
+        del answers[:]
+        warm = timed(route, repeat)
+        yield result('route ' + name, warm, query=query, answer_ms=statistics.median(answers) * 1000,
+                     cold_ms=cold * 1000, failed=bool(failures))
+
+
+def run(sizes, repeat, page_size=None, **server_options):
+    profile = tempfile.mkdtemp(prefix='drnu-bench-')
+    with FixtureServer(FixtureApi(page_size=page_size), seed=1, **server_options) as server:
+        kodi_stubs.install(profile, {'area': '1', 'api.url': server.api_url})
+        from resources.lib import addon, tvapi
+
+        fixtures = server.api
+        results = []
+        for benchmark in (bench_listings(addon, fixtures, sizes, repeat),
+                          bench_paging(tvapi, fixtures, server.api_url, profile, sizes, repeat),
+                          bench_decrypt(tvapi, repeat),
+                          bench_vtt2srt(tvapi, profile, repeat),
+                          bench_parse_date(addon, fixtures, sizes, repeat),
+                          bench_routes(addon, repeat)):
+            for entry in benchmark:
+                results.append(entry)
+                print('{:28s} {:>6s} {:10.2f} ms'.format(entry['name'], str(entry.get('n', '')), entry['median_ms']),
+                      file=sys.stderr)
+
+    with open(os.path.join(ROOT, 'addon.xml'), encoding='utf-8') as fh:
+        version = re.search(r'<addon[^>]* version="([^"]+)"', fh.read()).group(1)
+    return {
+        'addon': version,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'repeat': repeat,
+        'server': dict(server_options, page_size=page_size),
+        'results': results,
+    }
+
+
+def key(entry):
+    return entry['name'], entry.get('n')
+
+
+def compare(before, after):
+    old = {key(entry): entry for entry in before['results']}
+    print('{:28s} {:>8s} {:>12s} {:>12s} {:>7s}'.format('benchmark', 'n', before['addon'], after['addon'], 'ratio'))
+    for entry in after['results']:
+        if key(entry) in old:
+            previous = old[key(entry)]['median_ms']
+            print('{:28s} {:>8s} {:10.2f} ms {:10.2f} ms {:6.2f}x'.format(
+                entry['name'], str(entry.get('n', '')), previous, entry['median_ms'],
+                previous / entry['median_ms'] if entry['median_ms'] else 0))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='100,1000,10000', help='comma separated list sizes')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', action='store_true', help='print the results as json')
+    parser.add_argument('--output', help='write the results as json to this file')
+    parser.add_argument('--compare', help='results json of an earlier run to compare with')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds the server adds to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='up to this many seconds more')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests failing with a 503')
+    parser.add_argument('--page-size', type=int, help='most items per page served')
+    args = parser.parse_args()
+
+    results = run([int(size) for size in args.sizes.split(',')], args.repeat, args.page_size,
+                  latency=args.latency, jitter=args.jitter, error_rate=args.error_rate)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(results, fh, indent=2)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    if args.compare:
+        with open(args.compare) as fh:
+            compare(json.load(fh), results)
+
+
+if __name__ == '__main__':
+    main()
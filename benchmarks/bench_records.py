@@ -0,0 +1,104 @@
+#
+#      Copyright (C) 2014 Tommy Winther, msj33, TermeHansen
+#
+#  https://github.com/xbmc-danish-addons/plugin.video.drnu
+#
+#  This Program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2, or (at your option)
+#  any later version.
+#
+#  This Program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this Program; see the file LICENSE.txt.  If not, write to
+#  the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
+#  http://www.gnu.org/copyleft/gpl.html
+#
+#
+# Memory held by the items of a full A-Z crawl, every series of every index of getAZIndexes,
+# as the api dicts _handle_paging used to keep against the ItemRecords it keeps now.
+# The pages come from the fixture api and are decoded with json.loads like _http_request does.
+#
+#   python benchmarks/bench_records.py [--per-index 400] [--json]
+#
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(BENCHMARKS, '..'), BENCHMARKS]
+from fixture_server import FixtureApi  # noqa: E402
+from resources.lib import tvapi  # noqa: E402
+
+
+def handle_paging_dicts(api, result):
+    # _handle_paging as it was before the ItemRecords
+    items = result['Items']
+    if 'Next' not in result['Paging']:
+        return items
+    for result in api.concurrent_map(api._http_request, api._page_urls(result)):
+        items.extend(result['Items'])
+    while 'Next' in result['Paging']:
+        result = api._http_request(result['Paging']['Next'])
+        items.extend(result['Items'])
+    return items
+
+
+def crawl(api, handle_paging):
+    items = []
+    for index in api.getAZIndexes():
+        url = '{}/search/tv/programcards-latest-episode-with-asset/series-title-starts-with/{}?limit=75'.format(
+            api.API_URL, index['_Param'])
+        items.extend(handle_paging(api._http_request(url)))
+    return items
+
+
+def measure(api, handle_paging):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    items = crawl(api, handle_paging)
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'items': len(items), 'held_bytes': held, 'peak_bytes': peak, 'bytes_per_item': held / len(items),
+            'seconds': elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--per-index', type=int, default=400, help='series in each A-Z index')
+    parser.add_argument('--json', action='store_true', help='print the results as json')
+    args = parser.parse_args()
+
+    fixtures = FixtureApi(list_size=args.per_index)
+    api = tvapi.Api(tempfile.mkdtemp(prefix='drnu-bench-'), str, workers=1)
+    # one decoded page per request, as _http_request returns them
+    api._http_request = lambda url: json.loads(fixtures.respond(url)[2])
+
+    dicts = measure(api, lambda result: handle_paging_dicts(api, result))
+    records = measure(api, api._handle_paging)
+    assert dicts['items'] == records['items']
+    results = {'dicts': dicts, 'records': records}
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for name, result in results.items():
+        print('{:8s} {items:6d} items  held {held:7.1f} MiB ({bytes_per_item:6.0f} bytes/item)  peak {peak:7.1f} MiB'
+              '  {seconds:5.2f} s'.format(name, held=result['held_bytes'] / 2**20, peak=result['peak_bytes'] / 2**20,
+                                          **result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+#
+#      Copyright (C) 2014 Tommy Winther, msj33, TermeHansen
+#
+#  https://github.com/xbmc-danish-addons/plugin.video.drnu
+#
+#  This Program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2, or (at your option)
+#  any later version.
+#
+#  This Program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this Program; see the file LICENSE.txt.  If not, write to
+#  the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
+#  http://www.gnu.org/copyleft/gpl.html
+#
+#
+# Per item cost of listSeries and listEpisodes on 5000 item listings, the RenderPlan against
+# the per item loops it replaced, with the kodi stubs and items made from the api fixtures.
+#
+#   python benchmarks/bench_render.py [--items 5000] [--json]
+#
+import argparse
+import json
+import os
+import sys
+import tempfile
+import timeit
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(BENCHMARKS, '..'), BENCHMARKS]
+import kodi_stubs  # noqa: E402
+from fixture_server import FixtureApi  # noqa: E402
+
+kodi_stubs.install(tempfile.mkdtemp(prefix='drnu-bench-'))
+from resources.lib import addon  # noqa: E402
+import xbmcgui  # noqa: E402
+
+
+def series_items_loop(self, items, favorites):
+    # listSeries as it was before the RenderPlan
+    directoryItems = list()
+    fanart_h = int(addon.get_setting('fanart.size'))
+    fanart_w = int(fanart_h*16/9)
+    for item in items:
+        menuItems = list(self.menuItems)
+
+        title = item['SeriesTitle'].replace('&', '%26').replace(',', '%2C')
+        if title in favorites:
+            runScript = f"RunPlugin(plugin://plugin.video.drnu/?delfavorite={title})"
+            menuItems.append((addon.tr(30201), runScript))
+        else:
+            runScript = f"RunPlugin(plugin://plugin.video.drnu/?addfavorite={title})"
+            menuItems.append((addon.tr(30200), runScript))
+
+        listItem = xbmcgui.ListItem(item['SeriesTitle'], offscreen=True)
+        listItem.setArt({'thumb': self.api.redirectImageUrl(item['PrimaryImageUri'], 640, 360),
+                         'icon': self.api.redirectImageUrl(item['PrimaryImageUri'], 75, 42),
+                         'fanart': self.api.redirectImageUrl(item['PrimaryImageUri'], fanart_w, fanart_h)})
+        listItem.addContextMenuItems(menuItems, False)
+
+        url = self._plugin_url + '?listVideos=' + item['SeriesSlug']
+        directoryItems.append((url, listItem, True))
+    return directoryItems
+
+
+def episode_items_loop(self, items):
+    # listEpisodes as it was before the RenderPlan
+    directoryItems = list()
+    for item in items:
+        if 'PrimaryAsset' not in item or 'Uri' not in item['PrimaryAsset'] or not item['PrimaryAsset']['Uri']:
+            continue
+
+        infoLabels = {
+            'title': item['Title']
+        }
+        if 'Description' in item:
+            infoLabels['plot'] = item['Description']
+        if 'PrimaryBroadcastStartTime' in item and item['PrimaryBroadcastStartTime'] is not None:
+            broadcastTime = self.parseDate(item['PrimaryBroadcastStartTime'])
+            if broadcastTime:
+                infoLabels['date'] = broadcastTime.strftime('%d.%m.%Y')
+                infoLabels['aired'] = broadcastTime.strftime('%Y-%m-%d')
+                infoLabels['year'] = int(broadcastTime.strftime('%Y'))
+
+        listItem = xbmcgui.ListItem(item['Title'], offscreen=True)
+        fanart_h = int(addon.get_setting('fanart.size'))
+        fanart_w = int(fanart_h*16/9)
+        listItem.setArt({'thumb': self.api.redirectImageUrl(item['PrimaryImageUri'], 640, 360),
+                         'icon': self.api.redirectImageUrl(item['PrimaryImageUri'], 75, 42),
+                         'fanart': self.api.redirectImageUrl(item['PrimaryImageUri'], fanart_w, fanart_h)})
+        listItem.setInfo('video', infoLabels)
+        url = self._plugin_url + '?playVideo=' + item['Slug']
+        listItem.setProperty('IsPlayable', 'true')
+        listItem.addContextMenuItems(self.menuItems, False)
+        directoryItems.append((url, listItem))
+    return directoryItems
+
+
+def rendered(directoryItems):
+    return [(entry[0], entry[2:], item.label, item.art, item.info, item.properties, item.contextMenuItems)
+            for entry in directoryItems for item in (entry[1],)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=5000)
+    parser.add_argument('--json', action='store_true', help='print the results as json')
+    args = parser.parse_args()
+
+    handle = addon.DrDkTvAddon('plugin://plugin.video.drnu/', 1)
+    fixtures = FixtureApi()
+    series = fixtures.series('a', args.items)
+    episodes = fixtures.items('bonderoeven-tv', args.items)
+    # every tenth series a favorite
+    favorites = {item['SeriesTitle'] for item in series[::10]}
+
+    def plan():
+        return addon.RenderPlan(handle._plugin_url, handle.api, handle.menuItems)
+
+    cases = (
+        ('listSeries', lambda: series_items_loop(handle, series, favorites),
+         lambda: plan().seriesItems(series, favorites)),
+        ('listEpisodes', lambda: episode_items_loop(handle, episodes), lambda: plan().episodeItems(episodes)),
+    )
+    results = []
+    for name, loop, batch in cases:
+        assert rendered(loop()) == rendered(batch())
+        old = min(timeit.repeat(loop, number=1, repeat=5))
+        new = min(timeit.repeat(batch, number=1, repeat=5))
+        results.append({'name': name, 'items': args.items, 'loop_us_per_item': old / args.items * 1e6,
+                        'plan_us_per_item': new / args.items * 1e6})
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for result in results:
+        print('{name:13s} {items:6d} items  loop {loop_us_per_item:6.2f} us/item  plan {plan_us_per_item:6.2f} us/item'
+              '  {speedup:4.1f}x'.format(speedup=result['loop_us_per_item'] / result['plan_us_per_item'], **result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+#
+#      Copyright (C) 2014 Tommy Winther, msj33, TermeHansen
+#
+#  https://github.com/xbmc-danish-addons/plugin.video.drnu
+#
+#  This Program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2, or (at your option)
+#  any later version.
+#
+#  This Program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this Program; see the file LICENSE.txt.  If not, write to
+#  the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
+#  http://www.gnu.org/copyleft/gpl.html
+#
+# Cold start cost per route: every click in kodi is a fresh interpreter running default.py,
+# so each route is run in a new process with an empty profile and the kodi stubs.
+# The api points at a closed local port, so routes needing the network fail fast instead of waiting on it.
+#
+#   python benchmarks/bench_startup.py [--runs 5] [--json]
+#
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROUTES = (
+    ('main menu', '', {'area': '1'}),
+    ('area selector', '', {'area': '0'}),
+    ('A-Z', '?show=listAZ', {}),
+    ('favorites', '?show=favorites', {}),
+    ('recently watched', '?show=recentlyWatched', {}),
+    ('latest', '?show=latest', {}),
+    ('live tv', '?playLiveTV=dr1', {}),
+)
+HEAVY_MODULES = ('requests', 'requests_cache', 'sqlite3', 'resources.lib.tvgui')
+
+
+def run_route(query, settings, profile):
+    start = time.perf_counter()
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+    sys.path.insert(0, os.path.dirname(__file__))
+    import kodi_stubs
+    kodi_stubs.install(profile, settings)
+
+    imported = time.perf_counter()
+    from resources.lib import addon
+    from resources.lib import tvapi
+    tvapi.Api.API_URL = 'http://127.0.0.1:9/mu-online/api/1.2'
+
+    constructed = time.perf_counter()
+    handle = addon.DrDkTvAddon(plugin_url='plugin://plugin.video.drnu/', plugin_handle=1)
+    routed = time.perf_counter()
+    handle.route(query)
+    end = time.perf_counter()
+
+    answered = [t for name, t, _ in kodi_stubs.events if name in ('endOfDirectory', 'setResolvedUrl', 'dialog')]
+    return {
+        'import': constructed - imported,
+        'construct': routed - constructed,
+        # until kodi has the listing, the stream or an error dialog
+        'answer': (answered[0] if answered else end) - start,
+        'total': end - start,
+        'modules': [module for module in HEAVY_MODULES if module in sys.modules],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--json', action='store_true', help='print the results as json')
+    parser.add_argument('--route', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.route is not None:
+        query, settings, profile = json.loads(args.route)
+        print(json.dumps(run_route(query, settings, profile)))
+        return
+
+    # kodi keeps the compiled modules, so compile them once, aside from the tree
+    pycache = tempfile.TemporaryDirectory()
+    env = dict(os.environ, PYTHONPYCACHEPREFIX=pycache.name)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+
+    def run(query, settings):
+        with tempfile.TemporaryDirectory() as profile:
+            out = subprocess.run([sys.executable, __file__, '--route', json.dumps([query, settings, profile])],
+                                 check=True, capture_output=True, text=True, env=env).stdout
+        return json.loads(out.splitlines()[-1])
+
+    results = {}
+    for name, query, settings in ROUTES:
+        run(query, settings)
+        runs = [run(query, settings) for _ in range(args.runs)]
+        results[name] = {key: statistics.median(run[key] for run in runs) * 1000
+                         for key in ('import', 'construct', 'answer', 'total')}
+        results[name]['modules'] = runs[0]['modules']
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print('{:18s} {:>9s} {:>9s} {:>9s} {:>9s}  {}'.format('route (median ms)', 'import', 'construct', 'answer',
+                                                          'total', 'loaded'))
+    for name, result in results.items():
+        print('{:18s} {import:9.1f} {construct:9.1f} {answer:9.1f} {total:9.1f}  {loaded}'.format(
+            name, loaded=' '.join(result['modules']), **result))
+    pycache.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#
+#      Copyright (C) 2014 Tommy Winther, msj33, TermeHansen
+#
+#  https://github.com/xbmc-danish-addons/plugin.video.drnu
+#
+#  This Program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2, or (at your option)
+#  any later version.
+#
+#  This Program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this Program; see the file LICENSE.txt.  If not, write to
+#  the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
+#  http://www.gnu.org/copyleft/gpl.html
+#
+# Compares the streaming vtt2srt against the regex passes it replaced, on the subtitle files in
+# fixtures/subtitles, fed whole and in the 16 KiB chunks getVideoUrl reads them in.
+#
+#   python benchmarks/bench_vtt2srt.py
+#
+import glob
+import io
+import os
+import re
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from resources.lib import tvapi  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'subtitles', '*.vtt')
+
+
+def vtt2srt_regex(vtt):
+    # vtt2srt as it was before the single pass conversion
+    if isinstance(vtt, bytes):
+        vtt = vtt.decode('utf-8')
+    srt = vtt.replace("\r\n", "\n")
+    srt = re.sub(r'([\d]+)\.([\d]+)', r'\1,\2', srt)
+    srt = re.sub(r'WEBVTT\n\n', '', srt)
+    srt = re.sub(r'^\d+\n', '', srt)
+    srt = re.sub(r'\n\d+\n', '\n', srt)
+    srt = re.sub(r'\n([\d]+)', r'\nputINDEXhere\n\1', srt)
+
+    srtout = ['1']
+    idx = 2
+    for line in srt.splitlines():
+        if line == 'putINDEXhere':
+            line = str(idx)
+            idx += 1
+        srtout.append(line)
+    return '\n'.join(srtout)
+
+
+def vtt2srt_streaming(vtt, chunk_size=16384):
+    srt = io.StringIO()
+    tvapi.write_srt(tvapi.vtt_lines(chunks(vtt, chunk_size)), srt.write)
+    return srt.getvalue()
+
+
+def chunks(vtt, chunk_size):
+    return (vtt[i:i + chunk_size] for i in range(0, len(vtt), chunk_size))
+
+
+def peak_memory(func, vtt):
+    """ Peak of what is allocated on top of the downloaded vtt while converting it to a file """
+    with open(os.devnull, 'w', encoding='utf-8') as fh:
+        tracemalloc.start()
+        func(vtt, fh)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return peak
+
+
+def main(number=20):
+    for path in sorted(glob.glob(FIXTURES)):
+        with open(path, 'rb') as fh:
+            vtt = fh.read()
+
+        expected = vtt2srt_regex(vtt)
+        assert vtt2srt_streaming(vtt) == expected
+        assert vtt2srt_streaming(vtt, chunk_size=7) == expected
+
+        old = min(timeit.repeat(lambda: vtt2srt_regex(vtt), number=number, repeat=3)) / number
+        new = min(timeit.repeat(lambda: vtt2srt_streaming(vtt), number=number, repeat=3)) / number
+        print('{:20s} {:7d} bytes  regex {:8.3f} ms  streaming {:8.3f} ms  {:5.2f}x'.format(
+            os.path.basename(path), len(vtt), old * 1000, new * 1000, old / new))
+        print('{:20s} {:13s} peak  regex {:8d} kB  streaming {:8d} kB'.format(
+            '', '', peak_memory(lambda v, fh: fh.write(vtt2srt_regex(v)), vtt) // 1024,
+            peak_memory(lambda v, fh: tvapi.write_srt(tvapi.vtt_lines(chunks(v, 16384)), fh.write), vtt) // 1024))
+
+
+if __name__ == '__main__':
+    main()
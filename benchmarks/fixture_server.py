@@ -0,0 +1,265 @@
+#
+#      Copyright (C) 2014 Tommy Winther, msj33, TermeHansen
+#
+#  https://github.com/xbmc-danish-addons/plugin.video.drnu
+#
+#  This Program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2, or (at your option)
+#  any later version.
+#
+#  This Program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this Program; see the file LICENSE.txt.  If not, write to
+#  the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
+#  http://www.gnu.org/copyleft/gpl.html
+#
+#
+# Local stand-in for the mu-online api, answering from the fixtures in fixtures/api.
+# Listings are made from the recorded program card, with as many items as asked for:
+# a slug or letter ending in -<n> has n items, so /list/series-5000 has 5000 episodes.
+#
+# Responses recorded by the addon are replayed before the fixtures. To record, point the hidden
+# setting api.record of the addon at a file, every response _http_request fetches is appended to it.
+# To run the addon against the server, set the hidden setting api.url to the url it prints.
+#
+#   python benchmarks/fixture_server.py [--port 8080] [--replay recorded.jsonl]
+#       [--latency 0.05] [--jitter 0.02] [--error-rate 0.01] [--page-size 20] [--list-size 200]
+#
+import argparse
+import copy
+import http.server
+import json
+import os
+import random
+import re
+import threading
+import time
+import urllib.parse as urlparse
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+# the host the fixtures were recorded from, replaced by the address of the server
+DR_ORIGIN = 'https://www.dr.dk'
+DR_ORIGINS = (DR_ORIGIN, 'http://www.dr.dk')
+API_PATH = '/mu-online/api/1.2'
+
+
+def load(name):
+    with open(os.path.join(FIXTURES, 'api', name + '.json'), encoding='utf-8') as fh:
+        return json.load(fh)
+
+
+def size(slug, default):
+    match = re.search(r'-(\d+)$', slug)
+    return int(match.group(1)) if match else default
+
+
+def local(url):
+    # path and query, what a response is looked up by
+    parts = urlparse.urlsplit(url)
+    return urlparse.urlunsplit(('', '', parts.path, parts.query, ''))
+
+
+def load_recording(path):
+    """ :returns: {path and query: (status, content type, body)} of the responses recorded in path """
+    responses = {}
+    with open(path, encoding='utf-8') as fh:
+        for line in fh:
+            if line.strip():
+                response = json.loads(line)
+                # links to the api in the body are served from this server too, like those in the fixtures
+                parts = urlparse.urlsplit(response['url'])
+                body = response['body'].replace('{}://{}'.format(parts.scheme, parts.netloc), DR_ORIGIN)
+                responses[local(response['url'])] = (response['status'], response['content_type'],
+                                                     body.encode('utf-8'))
+    return responses
+
+
+class FixtureApi(object):
+    """ The responses of the server, also usable without it """
+
+    def __init__(self, list_size=200, page_size=None, recorded=None):
+        self.list_size = list_size
+        # caps the limit asked for, like the api does
+        self.page_size = page_size
+        # answers taking precedence over the fixtures, see load_recording
+        self.recorded = recorded or {}
+        self.card = load('programcard')
+        self.channels = load('channels')
+        self.themes = load('themes')
+        self.manifest = load('manifest')
+        with open(os.path.join(FIXTURES, 'subtitles', 'feature.vtt'), 'rb') as fh:
+            self.subtitles = fh.read()
+
+    def item(self, slug, i, series=None):
+        """ The recorded program card, made into episode i of series """
+        series = series or slug
+        item = copy.deepcopy(self.card)
+        item['Slug'] = '{}-{:d}'.format(series, i)
+        item['Urn'] = 'urn:dr:mu:programcard:{}'.format(item['Slug'])
+        item['Title'] = '{} ({:d})'.format(series.replace('-', ' ').title(), i + 1)
+        item['SeriesTitle'] = series.replace('-', ' ').title()
+        item['SeriesSlug'] = series
+        item['PrimaryImageUri'] += '{:06d}'.format(i)
+        item['PrimaryAsset']['Uri'] += '{:06d}'.format(i)
+        item['PrimaryBroadcastStartTime'] = '20{:02d}-{:02d}-{:02d}T{:02d}:00:00Z'.format(
+            10 + i // 4000 % 12, 1 + i // 300 % 12, 1 + i // 10 % 28, i % 24)
+        return item
+
+    def items(self, slug, count, offset=0, series=None):
+        return [self.item(slug, i, series) for i in range(offset, count)]
+
+    def series(self, letter, count, offset=0):
+        # one item per series, titles starting with the letter asked for
+        letter = letter.split('..')[0] or 'a'
+        return [self.item('{}-serie-{:d}'.format(letter, i), 0) for i in range(offset, count)]
+
+    def page(self, url, items, total, offset, limit):
+        result = {'Items': items, 'TotalSize': total, 'Paging': {'Source': url}}
+        if offset + limit < total:
+            parts = urlparse.urlsplit(url)
+            query = dict(urlparse.parse_qsl(parts.query))
+            query.update(offset=str(offset + limit), limit=str(limit))
+            result['Paging']['Next'] = urlparse.urlunsplit(parts._replace(query=urlparse.urlencode(query)))
+        return result
+
+    def paged(self, url, total, make):
+        query = dict(urlparse.parse_qsl(urlparse.urlsplit(url).query))
+        offset = int(query.get('offset', 0))
+        limit = int(query.get('limit', 75))
+        if self.page_size:
+            limit = min(limit, self.page_size)
+        end = min(offset + limit, total)
+        return self.page(url, make(end, offset), total, offset, limit)
+
+    def respond(self, url):
+        """ :returns: (status, content type, body) for a url below API_PATH or a subtitle url """
+        if local(url) in self.recorded:
+            return self.recorded[local(url)]
+        if url.startswith('/'):
+            # paging urls in the responses are absolute, like the ones of the api
+            url = DR_ORIGIN + url
+        path = urlparse.unquote(urlparse.urlsplit(url).path)
+        if path.endswith('.vtt'):
+            return 200, 'text/vtt', self.subtitles
+        if not path.startswith(API_PATH):
+            return 404, 'text/plain', b'not found'
+        path = path[len(API_PATH):]
+
+        if path.startswith('/channel/'):
+            body = self.channels
+        elif path.startswith('/page/tv/themes'):
+            body = self.themes
+        elif path.startswith('/page/tv/programs'):
+            body = {'Programs': {'Items': self.items('seneste', self.list_size)},
+                    'Indexes': [{'Title': 'A', 'Source': url + '/a'}]}
+        elif path.startswith('/list/view/'):
+            body = {'Items': self.items(path.rsplit('/', 1)[1], 48), 'Paging': {}, 'TotalSize': 48}
+        elif path.startswith('/list/'):
+            slug = path.rsplit('/', 1)[1]
+            body = self.paged(url, size(slug, self.list_size), lambda end, offset: self.items(slug, end, offset))
+        elif path.startswith('/search/tv/programcards-latest-episode-with-asset/'):
+            letter = path.rsplit('/', 1)[1]
+            body = self.paged(url, size(letter, self.list_size), lambda end, offset: self.series(letter, end, offset))
+        elif path.startswith('/search/tv/programcards-with-asset/'):
+            body = {'Items': self.items('soeg', 20), 'Paging': {}, 'TotalSize': 20}
+        elif path.startswith('/programcard/'):
+            series, _, i = path.rsplit('/', 1)[1].rpartition('-')
+            body = self.item(series, int(i)) if i.isdecimal() else self.item(path.rsplit('/', 1)[1], 0)
+        elif path.startswith('/manifest/'):
+            body = self.manifest
+        else:
+            return 404, 'text/plain', b'not found'
+        return 200, 'application/json', json.dumps(body, ensure_ascii=False).encode('utf-8')
+
+
+class FixtureServer(http.server.ThreadingHTTPServer):
+    """ Serves a FixtureApi on a free local port, the api is at api_url
+
+        with FixtureServer() as server:
+            tvapi.Api.API_URL = server.api_url
+    """
+    daemon_threads = True
+
+    def __init__(self, api=None, port=0, latency=0.0, jitter=0.0, error_rate=0.0, seed=None):
+        self.api = api or FixtureApi()
+        # seconds every response is delayed, plus up to jitter seconds more
+        self.latency = latency
+        self.jitter = jitter
+        # share of the requests answered with a 503
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        super().__init__(('127.0.0.1', port), FixtureHandler)
+        self.origin = 'http://127.0.0.1:{:d}'.format(self.server_port)
+        self.api_url = self.origin + API_PATH
+        self.requests = 0
+        self.errors = 0
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+
+class FixtureHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        server.requests += 1
+        delay = server.latency + server.random.uniform(0, server.jitter)
+        if delay:
+            time.sleep(delay)
+        if server.random.random() < server.error_rate:
+            server.errors += 1
+            status, content_type, body = 503, 'text/plain', b'injected error'
+        else:
+            status, content_type, body = server.api.respond(self.path)
+        if content_type.startswith('application/json'):
+            for origin in DR_ORIGINS:
+                body = body.replace(origin.encode(), server.origin.encode())
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--replay', action='append', default=[], help='responses recorded by the addon')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='up to this many seconds more')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests failing with a 503')
+    parser.add_argument('--page-size', type=int, help='most items per page, whatever the limit asked for')
+    parser.add_argument('--list-size', type=int, default=200, help='items in listings without a -<n> size')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    recorded = {}
+    for path in args.replay:
+        recorded.update(load_recording(path))
+    api = FixtureApi(args.list_size, args.page_size, recorded)
+    with FixtureServer(api, args.port, args.latency, args.jitter, args.error_rate, args.seed) as server:
+        print('serving {:d} recorded responses and the fixtures, set api.url to {}'.format(
+            len(recorded), server.api_url))
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
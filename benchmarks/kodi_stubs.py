@@ -0,0 +1,171 @@
+#
+#      Copyright (C) 2014 Tommy Winther, msj33, TermeHansen
+#
+#  https://github.com/xbmc-danish-addons/plugin.video.drnu
+#
+#  This Program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2, or (at your option)
+#  any later version.
+#
+#  This Program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this Program; see the file LICENSE.txt.  If not, write to
+#  the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
+#  http://www.gnu.org/copyleft/gpl.html
+#
+# Minimal stand-ins for the kodi modules, so the addon can be driven outside kodi by the benchmarks.
+# Directory listings, resolved urls, dialogs and log lines are recorded in `events`.
+#
+import os
+import re
+import sys
+import time
+import types
+import xml.etree.ElementTree as ElementTree
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# (name, perf_counter(), args)
+events = []
+
+
+def record(name, *args):
+    events.append((name, time.perf_counter(), args))
+
+
+def default_settings():
+    tree = ElementTree.parse(os.path.join(ROOT, 'resources', 'settings.xml'))
+    return {setting.get('id'): setting.get('default', '') for setting in tree.iter('setting') if setting.get('id')}
+
+
+def strings():
+    with open(os.path.join(ROOT, 'resources', 'language', 'resource.language.en_gb', 'strings.po'),
+              encoding='utf-8') as fh:
+        return {int(id): text for id, text in re.findall(r'msgctxt "#(\d+)"\nmsgid "(.*)"', fh.read())}
+
+
+class _Anything(object):
+    """ Accepts any constructor arguments and method calls """
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+class ListItem(object):
+    def __init__(self, label='', label2='', path='', offscreen=False):
+        self.label = label
+        self.path = path
+        self.art = {}
+        self.info = {}
+        self.properties = {}
+        self.contextMenuItems = []
+        self.subtitles = []
+
+    def getLabel(self):
+        return self.label
+
+    def setArt(self, art):
+        self.art.update(art)
+
+    def setInfo(self, type, infoLabels):
+        self.info.update(infoLabels)
+
+    def setProperty(self, key, value):
+        self.properties[key] = value
+
+    def addContextMenuItems(self, items, replaceItems=False):
+        self.contextMenuItems.extend(items)
+
+    def setSubtitles(self, subtitles):
+        self.subtitles = list(subtitles)
+
+
+class Dialog(object):
+    def ok(self, heading, message):
+        record('dialog', heading, message)
+        return True
+
+    def yesno(self, heading, message, *args, **kwargs):
+        record('dialog', heading, message)
+        return False
+
+    def select(self, heading, items, *args, **kwargs):
+        return -1
+
+    def notification(self, heading, message, *args, **kwargs):
+        record('notification', heading, message)
+
+
+class Keyboard(_Anything):
+    def isConfirmed(self):
+        return False
+
+    def getText(self):
+        return ''
+
+
+def install(profile, settings=None):
+    """ Put the stubs in sys.modules, with the addon profile in the directory profile
+
+    :param settings: addon settings overriding the defaults in settings.xml
+    """
+    values = default_settings()
+    values.update(settings or {})
+    texts = {}
+
+    class Addon(object):
+        def __init__(self, id=None):
+            pass
+
+        def getAddonInfo(self, key):
+            return {'path': ROOT, 'profile': profile, 'Profile': profile, 'name': 'DR TV',
+                    'id': 'plugin.video.drnu'}.get(key, '')
+
+        def getSetting(self, id):
+            return values.get(id, '')
+
+        def setSetting(self, id, value):
+            values[id] = value
+
+        def getLocalizedString(self, id):
+            if not texts:
+                texts.update(strings())
+            return texts.get(id, '')
+
+    xbmc = types.ModuleType('xbmc')
+    xbmc.LOGDEBUG, xbmc.LOGINFO, xbmc.LOGWARNING, xbmc.LOGERROR = 0, 1, 2, 3
+    xbmc.log = lambda msg, level=0: record('log', msg)
+    xbmc.Keyboard = Keyboard
+
+    xbmcaddon = types.ModuleType('xbmcaddon')
+    xbmcaddon.Addon = Addon
+
+    xbmcgui = types.ModuleType('xbmcgui')
+    xbmcgui.ListItem = ListItem
+    xbmcgui.Dialog = Dialog
+    xbmcgui.WindowDialog = _Anything
+    xbmcgui.ControlImage = xbmcgui.ControlLabel = xbmcgui.ControlButton = _Anything
+
+    xbmcplugin = types.ModuleType('xbmcplugin')
+    xbmcplugin.SORT_METHOD_DATE, xbmcplugin.SORT_METHOD_TITLE = 3, 9
+    xbmcplugin.addDirectoryItems = lambda handle, items, totalItems=0: record('addDirectoryItems', items)
+    xbmcplugin.addDirectoryItem = lambda handle, url, item, isFolder=False, totalItems=0: \
+        record('addDirectoryItems', [(url, item, isFolder)])
+    xbmcplugin.endOfDirectory = lambda handle, succeeded=True, *args, **kwargs: record('endOfDirectory', succeeded)
+    xbmcplugin.setResolvedUrl = lambda handle, succeeded, item: record('setResolvedUrl', succeeded, item)
+    xbmcplugin.setContent = lambda handle, content: None
+    xbmcplugin.addSortMethod = lambda handle, method, *args, **kwargs: None
+
+    xbmcvfs = types.ModuleType('xbmcvfs')
+    xbmcvfs.translatePath = lambda path: path
+
+    for module in (xbmc, xbmcaddon, xbmcgui, xbmcplugin, xbmcvfs):
+        sys.modules[module.__name__] = module
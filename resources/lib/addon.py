@@ -18,10 +18,11 @@
 #  the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
 #  http://www.gnu.org/copyleft/gpl.html
 #
+from collections import namedtuple
 import datetime
 import os
-import pickle
 import re
+import time
 import traceback
 import urllib.parse as urlparse
 
@@ -32,7 +33,7 @@ import xbmcplugin
 from xbmcvfs import translatePath
 
 from resources.lib import tvapi
-from resources.lib import tvgui
+from resources.lib.metrics import BUCKETS
 
 addon = xbmcaddon.Addon()
 get_setting = addon.getSetting
@@ -40,6 +41,9 @@ addon_path = addon.getAddonInfo('path')
 addon_name = addon.getAddonInfo('name')
 
 SLUG_ADULT = 'dr1,dr2,dr3,dr-k'
+SNAPSHOT_MAX_AGE = 3600*24
+# seconds playVideo may take before kodi gets the stream, subtitles not converted by then are left out
+RESOLVE_DEADLINE = 4
 
 
 def tr(id):
@@ -52,10 +56,167 @@ def bool_setting(name):
     return get_setting(name) == 'true'
 
 
+def int_setting(name, default=0):
+    try:
+        return int(get_setting(name))
+    except ValueError:
+        return default
+
+
 def make_notice(object):
     xbmc.log(str(object), xbmc.LOGDEBUG)
 
 
+# PrimaryBroadcastStartTime, like 2021-03-14T19:00:00Z
+BROADCAST_TIME = re.compile(r'(\d+)-(\d+)-(\d+)T(\d+):(\d+):(\d+)')
+
+
+def latency(ms):
+    # percentiles past the last histogram bucket have no upper bound
+    return '>{:d} ms'.format(BUCKETS[-1]) if ms is None else '{:d} ms'.format(ms)
+
+
+# handler is called with the addon and the value of parameter,
+# uses names what the handler needs of the addon ('api', 'store'), it is set up before the handler is timed
+Route = namedtuple('Route', 'name parameter value handler uses')
+
+# tried in order, a value of None matches any value of the parameter
+ROUTES = (
+    Route('liveTV', 'show', 'liveTV', lambda self, _: self.showLiveTV(), ('api',)),
+    Route('listAZ', 'show', 'listAZ', lambda self, _: self.showAZ(), ('api',)),
+    Route('latest', 'show', 'latest', lambda self, _: self.listEpisodes(
+        self.api.getLatestPrograms(SLUG_ADULT if bool_setting('disable.kids') else ''), addSortMethods=False),
+        ('api',)),
+    Route('mostViewed', 'show', 'mostViewed', lambda self, _: self.listEpisodes(self.api.getMostViewed()), ('api',)),
+    Route('highlights', 'show', 'highlights', lambda self, _: self.listEpisodes(self.api.getSelectedList()),
+          ('api',)),
+    Route('search', 'show', 'search', lambda self, _: self.searchSeries(), ('api', 'store')),
+    Route('favorites', 'show', 'favorites', lambda self, _: self.showFavorites(), ('api', 'store')),
+    Route('recentlyWatched', 'show', 'recentlyWatched', lambda self, _: self.showRecentlyWatched(),
+          ('api', 'store')),
+    Route('areaselector', 'show', 'areaselector', lambda self, _: self.showAreaSelector(), ('api', 'store')),
+    Route('themes', 'show', 'themes', lambda self, _: self.showThemes(), ('api',)),
+    Route('listThemeSeries', 'listThemeSeries', None, lambda self, theme: self.listThemeSeries(theme),
+          ('api', 'store')),
+    Route('listProgramSeriesByLetter', 'listProgramSeriesByLetter', None, lambda self, letter: self.listSeries(
+        self.api.getSeriesByLetter(letter)), ('api', 'store')),
+    Route('listVideos', 'listVideos', None, lambda self, slug: self.listVideos(slug), ('api',)),
+    Route('listChildren', 'listChildren', None, lambda self, channel: self.listChildren(channel), ('api', 'store')),
+    Route('playVideo', 'playVideo', None, lambda self, slug: self.playVideo(slug), ('api', 'store')),
+    # Supported slugs are dr1, dr2 and dr-ramasjang
+    Route('playLiveTV', 'playLiveTV', None, lambda self, slug: self.playLiveTV(slug), ('api',)),
+    Route('addfavorite', 'addfavorite', None, lambda self, key: self.addFavorite(key), ('api', 'store')),
+    Route('delfavorite', 'delfavorite', None, lambda self, key: self.delFavorite(key), ('store',)),
+    Route('diagnostics', 'show', 'diagnostics', lambda self, _: self.showDiagnostics(), ('api',)),
+    Route('exportDiagnostics', 'show', 'exportDiagnostics', lambda self, _: self.exportDiagnostics(), ('api',)),
+)
+
+# the start screen for each value of the area setting, when the query has no route
+AREA_ROUTES = {
+    0: Route('area:selector', None, None, lambda self, _: self.showAreaSelector(), ('api', 'store')),
+    1: Route('area:drtv', None, None, lambda self, _: self.showMainMenu(), ()),
+    2: Route('area:minisjang', None, None, lambda self, _: self.listChildren(
+        'dr-minisjang', add_area_selector=True), ('api', 'store')),
+    3: Route('area:ramasjang', None, None, lambda self, _: self.listChildren(
+        'dr-ramasjang', add_area_selector=True), ('api', 'store')),
+    5: Route('area:ultra', None, None, lambda self, _: self.listChildren(
+        'dr-ultra', add_area_selector=True), ('api', 'store')),
+}
+
+
+def find_route(params):
+    """ :returns: (route, value of its parameter), route is None when nothing matches """
+    for route in ROUTES:
+        if route.parameter in params and route.value in (None, params[route.parameter]):
+            return route, params[route.parameter]
+    if 'show' in params:
+        return None, None
+    try:
+        area = int(get_setting('area'))
+    except Exception:
+        area = 0
+    return AREA_ROUTES.get(area), None
+
+
+class RenderPlan(object):
+    """ What listSeries and listEpisodes need for every item, worked out once per listing,
+    so building the items is a single pass of lookups, concatenation and ListItem calls.
+    """
+
+    def __init__(self, plugin_url, api, menuItems):
+        fanart_h = int(get_setting('fanart.size'))
+        self.art = api.imageArt({'thumb': (640, 360), 'icon': (75, 42), 'fanart': (int(fanart_h*16/9), fanart_h)})
+        self.menuItems = menuItems
+        self.seriesUrl = plugin_url + '?listVideos='
+        self.episodeUrl = plugin_url + '?playVideo='
+        # the context menu of a series by whether it is a favorite, with the favorite toggle last, where only the
+        # title is filled in per series; addContextMenuItems copies the entries, so each list serves all series
+        self.seriesMenus = {
+            True: (menuItems + [None], tr(30201), 'RunPlugin(plugin://plugin.video.drnu/?delfavorite={})'),
+            False: (menuItems + [None], tr(30200), 'RunPlugin(plugin://plugin.video.drnu/?addfavorite={})'),
+        }
+        # (year, month, day) -> their info labels, as episodes of a listing often share a day
+        self._dates = {}
+
+    def dateLabels(self, dateString):
+        """ :returns: dict with the date, aired and year info labels, or None if dateString is no date """
+        m = BROADCAST_TIME.search(dateString)
+        if m is None:
+            return None
+        # only the day is shown
+        day = m.group(1, 2, 3)
+        labels = self._dates.get(day, False)
+        if labels is False:
+            try:
+                date = datetime.date(*map(int, day))
+                labels = {'date': '{:02d}.{:02d}.{:d}'.format(date.day, date.month, date.year),
+                          'aired': '{:d}-{:02d}-{:02d}'.format(date.year, date.month, date.day),
+                          'year': date.year}
+            except ValueError:
+                labels = None
+            self._dates[day] = labels
+        return labels
+
+    def seriesItems(self, items, favorites):
+        """ :param favorites: set of the favorite keys, the escaped series titles """
+        ListItem = xbmcgui.ListItem
+        directoryItems = []
+        for item in items:
+            title = item['SeriesTitle'].replace('&', '%26').replace(',', '%2C')
+            menu, label, runScript = self.seriesMenus[title in favorites]
+            menu[-1] = (label, runScript.format(title))
+
+            listItem = ListItem(item['SeriesTitle'], offscreen=True)
+            listItem.setArt(self.art(item['PrimaryImageUri']))
+            listItem.addContextMenuItems(menu, False)
+            directoryItems.append((self.seriesUrl + item['SeriesSlug'], listItem, True))
+        return directoryItems
+
+    def episodeItems(self, items):
+        ListItem = xbmcgui.ListItem
+        directoryItems = []
+        for item in items:
+            asset = item.get('PrimaryAsset')
+            if not asset or not asset.get('Uri'):
+                continue
+
+            infoLabels = {'title': item['Title']}
+            if 'Description' in item:
+                infoLabels['plot'] = item['Description']
+            if item.get('PrimaryBroadcastStartTime') is not None:
+                dateLabels = self.dateLabels(item['PrimaryBroadcastStartTime'])
+                if dateLabels:
+                    infoLabels.update(dateLabels)
+
+            listItem = ListItem(item['Title'], offscreen=True)
+            listItem.setArt(self.art(item['PrimaryImageUri']))
+            listItem.setInfo('video', infoLabels)
+            listItem.setProperty('IsPlayable', 'true')
+            listItem.addContextMenuItems(self.menuItems, False)
+            directoryItems.append((self.episodeUrl + item['Slug'], listItem))
+        return directoryItems
+
+
 class DrDkTvAddon(object):
     def __init__(self, plugin_url, plugin_handle):
         self._plugin_url = plugin_url
@@ -65,50 +226,48 @@ class DrDkTvAddon(object):
         if not os.path.exists(self.cache_path):
             os.makedirs(self.cache_path)
 
-        self.favorites_path = os.path.join(self.cache_path, 'favorites.pickle')
-        self.recent_path = os.path.join(self.cache_path, 'recent.pickle')
         self.fanart_image = os.path.join(addon_path, 'resources', 'fanart.jpg')
 
-        self.api = tvapi.Api(self.cache_path, tr)
-        self.favorites = list()
-        self.recentlyWatched = list()
+        self._api = None
+        self._store = None
+        self._area_item = None
+        # all parameters of the query, for what a route needs besides the value of its own
+        self.params = {}
 
         self.menuItems = list()
         runScript = "RunAddon(plugin.video.drnu,?show=areaselector&random={:d})".format(
             self._plugin_handle)
         self.menuItems.append((tr(30511), runScript))
 
-        # Area Selector
-        self.area_item = xbmcgui.ListItem(tr(30101), offscreen=True)
-        self.area_item.setArt({'fanart': self.fanart_image, 'icon': os.path.join(
-            addon_path, 'resources', 'icons', 'all.png')})
-
-        self._load()
-
-    def _save(self):
-        # save favorites
-        self.favorites.sort()
-        pickle.dump(self.favorites, open(self.favorites_path, 'wb'))
-
-        self.recentlyWatched = self.recentlyWatched[0:25]  # Limit to 25 items
-        pickle.dump(self.recentlyWatched, open(self.recent_path, 'wb'))
-
-    def _load(self):
-        # load favorites
-        if os.path.exists(self.favorites_path):
-            try:
-                self.favorites = pickle.load(open(self.favorites_path, 'rb'))
-            except Exception:
-                pass
-
-        # load recently watched
-        if os.path.exists(self.recent_path):
-            try:
-                self.recentlyWatched = pickle.load(open(self.recent_path, 'rb'))
-            except Exception:
-                pass
+    # the api, the store and the area selector item are set up by the first route that uses them
+
+    @property
+    def api(self):
+        if self._api is None:
+            self._api = tvapi.Api(self.cache_path, tr, pool_size=int_setting('http.poolsize', 10),
+                                  workers=int_setting('http.workers', 4),
+                                  cache_size=int_setting('cache.size', 50)*1024*1024,
+                                  api_url=get_setting('api.url'), record=get_setting('api.record'))
+        return self._api
+
+    @property
+    def store(self):
+        # favorites and recently watched, with the snapshots they are listed from
+        if self._store is None:
+            from resources.lib.store import LocalStore
+            self._store = LocalStore(os.path.join(self.cache_path, 'local.db'))
+        return self._store
+
+    @property
+    def area_item(self):
+        if self._area_item is None:
+            self._area_item = xbmcgui.ListItem(tr(30101), offscreen=True)
+            self._area_item.setArt({'fanart': self.fanart_image, 'icon': os.path.join(
+                addon_path, 'resources', 'icons', 'all.png')})
+        return self._area_item
 
     def showAreaSelector(self):
+        from resources.lib import tvgui
         gui = tvgui.AreaSelectorDialog()
         gui.doModal()
         areaSelected = gui.areaSelected
@@ -119,8 +278,7 @@ class DrDkTvAddon(object):
         elif areaSelected == 'drtv':
             self.showMainMenu()
         else:
-            items = self.api.getChildrenFrontItems('dr-' + areaSelected)
-            self.listSeries(items, add_area_selector=bool_setting('enable.areaitem'))
+            self.listChildren('dr-' + areaSelected, add_area_selector=bool_setting('enable.areaitem'))
 
     def showMainMenu(self):
         items = list()
@@ -194,51 +352,82 @@ class DrDkTvAddon(object):
         xbmcplugin.endOfDirectory(self._plugin_handle)
 
     def showFavorites(self):
-        self._load()
-        if not self.favorites:
+        favorites = self.store.favorites()
+        if not favorites:
             xbmcgui.Dialog().ok(addon_name, tr(30013))
             xbmcplugin.endOfDirectory(self._plugin_handle, succeeded=False)
         else:
+            snapshots = self.store.favorite_snapshots()
+            # only favorites without a snapshot (added by older versions) have to wait for the api
+            missing = [key for key in favorites if key not in snapshots]
+            if missing:
+                self.refreshFavorites(missing)
+                snapshots = self.store.favorite_snapshots()
             series = []
-            for slug in self.favorites:
-                series.extend(self.api.searchSeries(slug))
+            for key in favorites:
+                series.extend(snapshots.get(key, {}).get('items', []))
             self.listSeries(series, addToFavorites=False)
+            # for the next visit, after the listing, failures are logged by runDeferred
+            self.api.defer(self.refreshFavorites, self._stale(favorites, snapshots))
 
     def showRecentlyWatched(self):
-        self._load()
-        videos = list()
-        for slug in self.recentlyWatched:
-            try:
-                item = self.api.getEpisode(slug)
-                if item is None:
-                    self.recentlyWatched.remove(slug)
-                else:
-                    videos.append(item)
-            except tvapi.ApiException:
-                # probably a 404 - non-existent slug
-                self.recentlyWatched.remove(slug)
-
-        self._save()
+        recent = self.store.recent()
+        snapshots = self.store.recent_snapshots()
+        missing = [slug for slug in recent if slug not in snapshots]
+        if missing:
+            self.refreshRecentlyWatched(missing)
+            recent, snapshots = self.store.recent(), self.store.recent_snapshots()
+        videos = [snapshots[slug]['item'] for slug in recent if slug in snapshots]
         if not videos:
             xbmcgui.Dialog().ok(addon_name, tr([30013, 30020]))
             xbmcplugin.endOfDirectory(self._plugin_handle, succeeded=False)
         else:
             self.listEpisodes(videos)
+            self.api.defer(self.refreshRecentlyWatched, self._stale(recent, snapshots))
+
+    def _stale(self, keys, snapshots):
+        now = time.time()
+        return [key for key in keys if key in snapshots and now - snapshots[key]['fetched'] > SNAPSHOT_MAX_AGE]
+
+    def refreshFavorites(self, keys):
+        if not keys:
+            return
+
+        def searchSeries(key):
+            try:
+                items = self.api.searchSeries(key, fallback=False)
+            except tvapi.ApiException:
+                return None
+            return [tvapi.snapshot(item, tvapi.SERIES_FIELDS) for item in items]
+
+        results = self.api.concurrent_map(searchSeries, keys)
+        for key, items in zip(keys, results):
+            if items is not None:
+                self.store.set_favorite_items(key, items)
+
+    def refreshRecentlyWatched(self, slugs):
+        if not slugs:
+            return
+
+        def getEpisode(slug):
+            try:
+                return self.api.getEpisode(slug)
+            except tvapi.ApiException:
+                # probably a 404 - non-existent slug
+                return None
+
+        results = self.api.concurrent_map(getEpisode, slugs)
+        for slug, item in zip(slugs, results):
+            if item is None:
+                self.store.remove_recent(slug)
+            else:
+                self.store.set_recent_item(slug, tvapi.snapshot(item, tvapi.EPISODE_FIELDS))
 
     def showLiveTV(self):
         items = list()
         HLS = 'HLS_subtitles' if bool_setting('enable.subtitles') else 'HLS'
-        for channel in self.api.getLiveTV():
-            if channel['WebChannel']:
-                continue
-
-            server = None
-            for streamingServer in channel['StreamingServers']:
-                if streamingServer['LinkType'] == HLS:
-                    server = streamingServer
-                    break
-
-            if server is None:
+        for channel in self.api.getLiveChannels().values():
+            if channel['WebChannel'] or HLS not in channel['Streams']:
                 continue
 
             item = xbmcgui.ListItem(channel['Title'], offscreen=True)
@@ -248,9 +437,7 @@ class DrDkTvAddon(object):
                          'icon': self.api.redirectImageUrl(channel['PrimaryImageUri'], 75, 42),
                          'fanart': self.api.redirectImageUrl(channel['PrimaryImageUri'], fanart_w, fanart_h)})
             item.addContextMenuItems(self.menuItems, False)
-
-            url = server['Server'] + '/' + server['Qualities'][0]['Streams'][0]['Stream']
-            items.append((url, item, False))
+            items.append((channel['Streams'][HLS], item, False))
 
         items.sort(key=lambda x: x[1].getLabel().replace(' ', ''))
 
@@ -261,7 +448,8 @@ class DrDkTvAddon(object):
         # All Program Series
         iconImage = os.path.join(addon_path, 'resources', 'icons', 'all.png')
         items = list()
-        for programIndex in self.api.getAZIndexes():
+        indexes = self.api.getAZIndexes()
+        for programIndex in indexes:
             item = xbmcgui.ListItem(programIndex['Title'], offscreen=True)
             item.setArt({'fanart': self.fanart_image, 'icon': iconImage})
             item.addContextMenuItems(self.menuItems, False)
@@ -270,6 +458,7 @@ class DrDkTvAddon(object):
             items.append((url, item, True))
         xbmcplugin.addDirectoryItems(self._plugin_handle, items)
         xbmcplugin.endOfDirectory(self._plugin_handle)
+        self.api.defer(self.api.refreshCatalog, [programIndex['_Param'] for programIndex in indexes])
 
     def showThemes(self):
         iconImage = os.path.join(addon_path, 'resources', 'icons', 'all.png')
@@ -287,6 +476,34 @@ class DrDkTvAddon(object):
         xbmcplugin.addDirectoryItems(self._plugin_handle, items)
         xbmcplugin.endOfDirectory(self._plugin_handle)
 
+    def showDiagnostics(self):
+        """ One line per api endpoint with the metrics added up over all invocations """
+        iconImage = os.path.join(addon_path, 'resources', 'icons', 'all.png')
+        items = list()
+        item = xbmcgui.ListItem(tr(30537), offscreen=True)
+        item.setArt({'fanart': self.fanart_image, 'icon': iconImage})
+        items.append((self._plugin_url + '?show=exportDiagnostics', item, False))
+
+        for row in self.api.metrics.summary():
+            sources = row['sources']
+            label = tr(30542).format(row['endpoint'], row['requests'], latency(row['p50']), latency(row['p95']),
+                                     latency(row['p99']), row['bytes'] // 1024, sources['object'] + sources['http'],
+                                     sources['stale'], sources['network'], row['errors'])
+            item = xbmcgui.ListItem(label, offscreen=True)
+            item.setArt({'fanart': self.fanart_image, 'icon': iconImage})
+            item.setInfo('video', {'title': label, 'plot': '\n'.join(
+                '{} {:d}'.format(bucket, count) for bucket, count in row['histogram'].items() if count)})
+            # opening a line shows the list again, with the latest counts
+            items.append((self._plugin_url + '?show=diagnostics', item, True))
+
+        xbmcplugin.addDirectoryItems(self._plugin_handle, items)
+        xbmcplugin.endOfDirectory(self._plugin_handle)
+
+    def exportDiagnostics(self):
+        path = os.path.join(self.cache_path, 'diagnostics.json')
+        self.api.metrics.export(path)
+        xbmcgui.Dialog().ok(tr(30536), '\n'.join([tr(30538), path]))
+
     def searchSeries(self):
         keyboard = xbmc.Keyboard('', tr(30003))
         keyboard.doModal()
@@ -294,7 +511,43 @@ class DrDkTvAddon(object):
             keyword = keyboard.getText()
             self.listSeries(self.api.searchSeries(keyword))
 
-    def listSeries(self, items, addToFavorites=True, add_area_selector=False):
+    def pageSize(self):
+        """ :returns: items per page of the long listings, 0 when they are listed whole """
+        return int_setting('paging.size', 75) if bool_setting('paging.enabled') else 0
+
+    def nextPageItem(self, url):
+        item = xbmcgui.ListItem(tr(30541), offscreen=True)
+        item.setArt({'fanart': self.fanart_image, 'icon': os.path.join(addon_path, 'resources', 'icons', 'all.png')})
+        # stays last whatever the listing is sorted on
+        item.setProperty('SpecialSort', 'bottom')
+        return url, item, True
+
+    def listVideos(self, slug):
+        limit = self.pageSize()
+        if not limit:
+            self.listEpisodes(self.api.getEpisodes(slug))
+            return
+        items, offset = self.api.getEpisodesPage(slug, int(self.params.get('offset', 0)), limit)
+        self.listEpisodes(items, nextPage=offset and f'{self._plugin_url}?listVideos={slug}&offset={offset:d}')
+
+    def listThemeSeries(self, theme):
+        limit = self.pageSize()
+        if not limit:
+            self.listSeries(self.api.getEpisodes(theme))
+            return
+        items, offset = self.api.getEpisodesPage(theme, int(self.params.get('offset', 0)), limit)
+        self.listSeries(items, nextPage=offset and f'{self._plugin_url}?listThemeSeries={theme}&offset={offset:d}')
+
+    def listChildren(self, channel, add_area_selector=False):
+        limit = self.pageSize()
+        if not limit:
+            self.listSeries(self.api.getChildrenFrontItems(channel), add_area_selector=add_area_selector)
+            return
+        items, offset = self.api.getChildrenFrontPage(channel, int(self.params.get('offset', 0)), limit)
+        self.listSeries(items, add_area_selector=add_area_selector,
+                        nextPage=offset and f'{self._plugin_url}?listChildren={channel}&offset={offset:d}')
+
+    def listSeries(self, items, addToFavorites=True, add_area_selector=False, nextPage=None):
         if not items:
             xbmcplugin.endOfDirectory(self._plugin_handle, succeeded=False)
             if not addToFavorites:
@@ -306,60 +559,19 @@ class DrDkTvAddon(object):
             if add_area_selector:
                 directoryItems.append(
                     (self._plugin_url + '?show=areaselector', self.area_item, True))
-            fanart_h = int(get_setting('fanart.size'))
-            fanart_w = int(fanart_h*16/9)
-            for item in items:
-                menuItems = list(self.menuItems)
-
-                title = item['SeriesTitle'].replace('&', '%26').replace(',', '%2C')
-                if title in self.favorites:
-                    runScript = f"RunPlugin(plugin://plugin.video.drnu/?delfavorite={title})"
-                    menuItems.append((tr(30201), runScript))
-                else:
-                    runScript = f"RunPlugin(plugin://plugin.video.drnu/?addfavorite={title})"
-                    menuItems.append((tr(30200), runScript))
-
-                listItem = xbmcgui.ListItem(item['SeriesTitle'], offscreen=True)
-                listItem.setArt({'thumb': self.api.redirectImageUrl(item['PrimaryImageUri'], 640, 360),
-                                 'icon': self.api.redirectImageUrl(item['PrimaryImageUri'], 75, 42),
-                                 'fanart': self.api.redirectImageUrl(item['PrimaryImageUri'], fanart_w, fanart_h)})
-                listItem.addContextMenuItems(menuItems, False)
-
-                url = self._plugin_url + '?listVideos=' + item['SeriesSlug']
-                directoryItems.append((url, listItem, True))
+            # for the favorite toggle in the context menu
+            favorites = set(self.store.favorites())
+            directoryItems.extend(RenderPlan(self._plugin_url, self.api, self.menuItems).seriesItems(items, favorites))
+            if nextPage:
+                directoryItems.append(self.nextPageItem(nextPage))
 
             xbmcplugin.addDirectoryItems(self._plugin_handle, directoryItems)
             xbmcplugin.endOfDirectory(self._plugin_handle)
 
-    def listEpisodes(self, items, addSortMethods=True):
-        directoryItems = list()
-        for item in items:
-            if 'PrimaryAsset' not in item or 'Uri' not in item['PrimaryAsset'] or not item['PrimaryAsset']['Uri']:
-                continue
-
-            infoLabels = {
-                'title': item['Title']
-            }
-            if 'Description' in item:
-                infoLabels['plot'] = item['Description']
-            if 'PrimaryBroadcastStartTime' in item and item['PrimaryBroadcastStartTime'] is not None:
-                broadcastTime = self.parseDate(item['PrimaryBroadcastStartTime'])
-                if broadcastTime:
-                    infoLabels['date'] = broadcastTime.strftime('%d.%m.%Y')
-                    infoLabels['aired'] = broadcastTime.strftime('%Y-%m-%d')
-                    infoLabels['year'] = int(broadcastTime.strftime('%Y'))
-
-            listItem = xbmcgui.ListItem(item['Title'], offscreen=True)
-            fanart_h = int(get_setting('fanart.size'))
-            fanart_w = int(fanart_h*16/9)
-            listItem.setArt({'thumb': self.api.redirectImageUrl(item['PrimaryImageUri'], 640, 360),
-                             'icon': self.api.redirectImageUrl(item['PrimaryImageUri'], 75, 42),
-                             'fanart': self.api.redirectImageUrl(item['PrimaryImageUri'], fanart_w, fanart_h)})
-            listItem.setInfo('video', infoLabels)
-            url = self._plugin_url + '?playVideo=' + item['Slug']
-            listItem.setProperty('IsPlayable', 'true')
-            listItem.addContextMenuItems(self.menuItems, False)
-            directoryItems.append((url, listItem))
+    def listEpisodes(self, items, addSortMethods=True, nextPage=None):
+        directoryItems = RenderPlan(self._plugin_url, self.api, self.menuItems).episodeItems(items)
+        if nextPage:
+            directoryItems.append(self.nextPageItem(nextPage))
 
         xbmcplugin.setContent(self._plugin_handle, 'episodes')
         xbmcplugin.addDirectoryItems(self._plugin_handle, directoryItems)
@@ -368,50 +580,67 @@ class DrDkTvAddon(object):
             xbmcplugin.addSortMethod(self._plugin_handle, xbmcplugin.SORT_METHOD_TITLE)
         xbmcplugin.endOfDirectory(self._plugin_handle)
 
+        if bool_setting('prefetch.enabled'):
+            self.api.defer(self.prefetch, items, int_setting('prefetch.count', 3))
+
+    def prefetch(self, items, count):
+        start = time.perf_counter()
+        received = self.api.received
+        resolved = self.api.prefetch(items, count)
+        make_notice('drnu prefetched {:d} of {:d} items in {:.0f} ms, {:d} kB'.format(
+            resolved, count, (time.perf_counter() - start) * 1000, (self.api.received - received) // 1024))
+
     def playVideo(self, slug):
-        self.updateRecentlyWatched(slug)
+        start = time.perf_counter()
+        stages = []
         api_item = self.api.getEpisode(slug)
+        stages.append(('episode', time.perf_counter()))
+        # bookkeeping can wait until kodi has the stream
+        self.api.defer(self.updateRecentlyWatched, slug, api_item)
         kids_channel = api_item.get('PrimaryChannelSlug', 'no_channel_slug') in [
                                     'dr-minisjang', 'dr-ramasjang', 'dr-ultra']
         if 'PrimaryAsset' not in api_item:
             self.displayError(tr(30904))
             return
 
-        video = self.api.getVideoUrl(api_item['PrimaryAsset']['Uri'])
-        item = xbmcgui.ListItem(path=video['Uri'], offscreen=True)
+        prefetched = self.api.takePrefetched(api_item['PrimaryAsset']['Uri'])
+        asset = self.api.getAsset(api_item['PrimaryAsset']['Uri'])
+        stages.append(('asset', time.perf_counter()))
+        item = xbmcgui.ListItem(path=asset['Uri'], offscreen=True)
         item.setArt({'thumb': api_item['PrimaryImageUri']})
 
         if not all([bool_setting('disable.kids.subtitles') and kids_channel]):
-            if video['SubtitlesUri']:
+            # slow subtitle servers only cost their tracks, not the stream
+            subtitlesUri = self.api.getSubtitles(asset['SubtitlesList'],
+                                                 max(0, RESOLVE_DEADLINE - (time.perf_counter() - start)))
+            stages.append(('subtitles', time.perf_counter()))
+            if subtitlesUri:
                 if bool_setting('enable.subtitles'):
-                    item.setSubtitles(video['SubtitlesUri'][::-1])
+                    item.setSubtitles(subtitlesUri[::-1])
                 else:
-                    item.setSubtitles(video['SubtitlesUri'])
-        xbmcplugin.setResolvedUrl(self._plugin_handle, video['Uri'] is not None, item)
+                    item.setSubtitles(subtitlesUri)
+        xbmcplugin.setResolvedUrl(self._plugin_handle, asset['Uri'] is not None, item)
+
+        # the part of the time to first frame that is ours, kodi takes it from here
+        timings = []
+        previous = start
+        for stage, end in stages:
+            timings.append('{} {:.0f} ms'.format(stage, (end - previous) * 1000))
+            previous = end
+        make_notice('drnu resolved {} in {:.0f} ms ({}, {})'.format(
+            slug, (time.perf_counter() - start) * 1000, ', '.join(timings),
+            'prefetched' if prefetched else 'not prefetched'))
 
     # Supported slugs are dr1, dr2 and dr-ramasjang
     def playLiveTV(self, slug):
-        item = None
-        url = None
         HLS = 'HLS_subtitles' if bool_setting('enable.subtitles') else 'HLS'
-        for channel in self.api.getLiveTV():
-            # If the channel has the right slug, play the channel
-            if channel['Slug'] == slug:
-                server = None
-                for streamingServer in channel['StreamingServers']:
-                    if streamingServer['LinkType'] == HLS:
-                        server = streamingServer
-                        break
-                if server is None:
-                    continue
-
-                url = server['Server'] + '/' + server['Qualities'][0]['Streams'][0]['Stream']
-                item = xbmcgui.ListItem(channel['Title'], path=url, offscreen=True)
-                item.setArt({'fanart': channel['PrimaryImageUri'],
-                            'icon': channel['PrimaryImageUri']})
-                item.addContextMenuItems(self.menuItems, False)
-                break
-        if item:
+        channel = self.api.getLiveChannels().get(slug)
+        if channel and HLS in channel['Streams']:
+            url = channel['Streams'][HLS]
+            item = xbmcgui.ListItem(channel['Title'], path=url, offscreen=True)
+            item.setArt({'fanart': channel['PrimaryImageUri'],
+                        'icon': channel['PrimaryImageUri']})
+            item.addContextMenuItems(self.menuItems, False)
             xbmcplugin.setResolvedUrl(self._plugin_handle, True, item)
         else:
             self.displayError(f'{tr(30905)} {slug}')
@@ -419,39 +648,25 @@ class DrDkTvAddon(object):
     def parseDate(self, dateString):
         if dateString is not None:
             try:
-                m = re.search(r'(\d+)-(\d+)-(\d+)T(\d+):(\d+):(\d+)', dateString)
-                year = int(m.group(1))
-                month = int(m.group(2))
-                day = int(m.group(3))
-                hours = int(m.group(4))
-                minutes = int(m.group(5))
-                seconds = int(m.group(6))
-                return datetime.datetime(year, month, day, hours, minutes, seconds)
+                m = BROADCAST_TIME.search(dateString)
+                return datetime.datetime(*map(int, m.groups()))
             except ValueError:
                 return None
         else:
             return None
 
     def addFavorite(self, key):
-        self._load()
-        if key not in self.favorites:
-            self.favorites.append(key)
-        self._save()
+        self.store.add_favorite(key)
         xbmcgui.Dialog().ok(addon_name, tr([30008, 30009]))
+        # the snapshot to list it from is fetched after the confirmation
+        self.api.defer(self.refreshFavorites, [key])
 
     def delFavorite(self, key):
-        self._load()
-        if key in self.favorites:
-            self.favorites.remove(key)
-        self._save()
+        self.store.remove_favorite(key)
         xbmcgui.Dialog().ok(addon_name, tr([30008, 30010]))
 
-    def updateRecentlyWatched(self, assetUri):
-        self._load()
-        if assetUri in self.recentlyWatched:
-            self.recentlyWatched.remove(assetUri)
-        self.recentlyWatched.insert(0, assetUri)
-        self._save()
+    def updateRecentlyWatched(self, assetUri, item=None):
+        self.store.touch_recent(assetUri, tvapi.snapshot(item, tvapi.EPISODE_FIELDS) if item is not None else None)
 
     def displayError(self, message='n/a'):
         heading = 'API error'
@@ -462,83 +677,59 @@ class DrDkTvAddon(object):
         xbmcgui.Dialog().ok(heading, '\n'.join([tr(30902), tr(30903), message]))
 
     def route(self, query):
+        start = time.perf_counter()
+        self.params = dict(urlparse.parse_qsl(query[1:]))
+        route, value = find_route(self.params)
+        setup = 0
+        error = None
         try:
-            PARAMS = dict(urlparse.parse_qsl(query[1:]))
-            if 'show' in PARAMS:
-                if PARAMS['show'] == 'liveTV':
-                    self.showLiveTV()
-                elif PARAMS['show'] == 'listAZ':
-                    self.showAZ()
-                elif PARAMS['show'] == 'latest':
-                    channel = SLUG_ADULT if bool_setting('disable.kids') else ''
-                    self.listEpisodes(self.api.getLatestPrograms(channel), addSortMethods=False)
-                elif PARAMS['show'] == 'mostViewed':
-                    self.listEpisodes(self.api.getMostViewed())
-                elif PARAMS['show'] == 'highlights':
-                    self.listEpisodes(self.api.getSelectedList())
-                elif PARAMS['show'] == 'search':
-                    self.searchSeries()
-                elif PARAMS['show'] == 'favorites':
-                    self.showFavorites()
-                elif PARAMS['show'] == 'recentlyWatched':
-                    self.showRecentlyWatched()
-                elif PARAMS['show'] == 'areaselector':
-                    self.showAreaSelector()
-                elif PARAMS['show'] == 'themes':
-                    self.showThemes()
-
-            elif 'listThemeSeries' in PARAMS:
-                self.listSeries(self.api.getEpisodes(PARAMS['listThemeSeries']))
-
-            elif 'listProgramSeriesByLetter' in PARAMS:
-                self.listSeries(self.api.searchSeries(
-                    PARAMS['listProgramSeriesByLetter'], startswith=True))
-
-            elif 'listVideos' in PARAMS:
-                self.listEpisodes(self.api.getEpisodes(PARAMS['listVideos']))
-
-            elif 'playVideo' in PARAMS:
-                self.playVideo(PARAMS['playVideo'])
-
-            # Supported slugs are dr1, dr2 and dr-ramasjang
-            elif 'playLiveTV' in PARAMS:
-                self.playLiveTV(PARAMS['playLiveTV'])
-
-            elif 'addfavorite' in PARAMS:
-                self.addFavorite(PARAMS['addfavorite'])
-
-            elif 'delfavorite' in PARAMS:
-                self.delFavorite(PARAMS['delfavorite'])
-
-            else:
-                try:
-                    area = int(get_setting('area'))
-                except Exception:
-                    area = 0
-
-                if area == 0:
-                    self.showAreaSelector()
-                elif area == 1:
-                    self.showMainMenu()
-                elif area == 2:
-                    items = self.api.getChildrenFrontItems('dr-minisjang')
-                    self.listSeries(items, add_area_selector=True)
-                elif area == 3:
-                    items = self.api.getChildrenFrontItems('dr-ramasjang')
-                    self.listSeries(items, add_area_selector=True)
-                elif area == 5:
-                    items = self.api.getChildrenFrontItems('dr-ultra')
-                    self.listSeries(items, add_area_selector=True)
+            if route is not None:
+                for name in route.uses:
+                    getattr(self, name)
+                setup = time.perf_counter() - start
+                route.handler(self, value)
 
         except tvapi.ApiException as ex:
+            error = ex
             self.displayError(str(ex))
 
         except IOError as ex:
+            error = ex
             self.displayIOError(str(ex))
 
-        except Exception:
+        except Exception as ex:
+            error = ex
             crash_file = os.path.join(self.cache_path, 'drnu.crash')
             with open(crash_file, 'w') as fh:
                 fh.write(traceback.format_exc())
             heading = 'drnu addon crash'
             xbmcgui.Dialog().ok(heading, '\n'.join([tr(30906), tr(30907), tr(30908), crash_file]))
+        answered = time.perf_counter()
+
+        # the listing is done, now run what was put off for later
+        errors = []
+        if self._api is not None:
+            errors = self._api.runDeferred()
+            for ex in errors:
+                make_notice(f'drnu deferred task failed: {ex}')
+            make_notice(self._api.objects.report())
+            try:
+                self._api.metrics.save()
+            except OSError as ex:
+                make_notice(f'drnu metrics not saved: {ex}')
+        self.report(route, start, setup, answered, error, errors)
+
+    def report(self, route, start, setup, answered, error, deferred_errors):
+        """ One line per invocation, for finding the slow screens """
+        end = time.perf_counter()
+        line = 'drnu route {}: {:.0f} ms (setup {:.0f} ms, deferred {:.0f} ms)'.format(
+            route.name if route else 'none', (answered - start) * 1000, setup * 1000, (end - answered) * 1000)
+        if self._api is not None:
+            line += ', {:d} api calls ({:d} network, {:d} object cache, {:d} http cache), {:d} kB received'.format(
+                self._api.apiCalls, self._api.networkCalls, self._api.objectHits, self._api.httpCacheHits,
+                self._api.received // 1024)
+        if error is not None:
+            line += ', failed: {}'.format(type(error).__name__)
+        if deferred_errors:
+            line += ', {:d} deferred tasks failed'.format(len(deferred_errors))
+        xbmc.log(line, xbmc.LOGINFO)
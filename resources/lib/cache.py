@@ -0,0 +1,281 @@
+#
+#      Copyright (C) 2014 Tommy Winther, msj33, TermeHansen
+#
+#  https://github.com/xbmc-danish-addons/plugin.video.drnu
+#
+#  This Program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2, or (at your option)
+#  any later version.
+#
+#  This Program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this Program; see the file LICENSE.txt.  If not, write to
+#  the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
+#  http://www.gnu.org/copyleft/gpl.html
+#
+from collections import OrderedDict
+import hashlib
+import os
+import pickle
+import threading
+import time
+import urllib.parse as urlparse
+
+
+class ObjectCache(object):
+    """ Already decoded api results, stored as one pickle file per canonical url,
+    so a hit costs one file read and one unpickle instead of a sqlite lookup, a Response and json.loads.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if not os.path.exists(path):
+            os.makedirs(path)
+        self.hits = 0
+        self.misses = 0
+        self.hit_time = 0.0
+        self.write_errors = 0
+        self.write_error = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(url):
+        parts = urlparse.urlsplit(url)
+        query = urlparse.urlencode(sorted(urlparse.parse_qsl(parts.query, keep_blank_values=True)))
+        canonical = urlparse.urlunsplit((parts.scheme, parts.netloc.lower(), parts.path, query, ''))
+        return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+    def _file(self, key):
+        return os.path.join(self.path, key + '.pickle')
+
+    def get(self, key):
+        """ :returns: tuple (fetched, object), or None if not cached """
+        start = time.perf_counter()
+        try:
+            with open(self._file(key), 'rb') as fh:
+                fetched, obj = pickle.load(fh)
+            # mtime is the last use, for the lru eviction in prune()
+            os.utime(self._file(key))
+        except Exception:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+            self.hit_time += time.perf_counter() - start
+        return fetched, obj
+
+    def put(self, key, fetched, obj):
+        """ Store obj, best effort: the caller already has it, a failed write only costs the next request """
+        # write aside and rename, so readers never see half a file
+        tmp = '{}.{:d}.tmp'.format(self._file(key), threading.get_ident())
+        try:
+            with open(tmp, 'wb') as fh:
+                pickle.dump((fetched, obj), fh, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self._file(key))
+        except OSError as ex:
+            # e.g. a full disk, shown by report()
+            with self._lock:
+                self.write_errors += 1
+                self.write_error = ex
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+    def prune(self, max_age, max_bytes):
+        """ Remove entries not used for max_age seconds, then the least recently used until at most max_bytes are used
+
+        :returns: number of removed entries
+        """
+        now = time.time()
+        entries = []
+        removed = 0
+        # other invocations write and rename in the same directory meanwhile, files may vanish under us
+        for entry in os.scandir(self.path):
+            try:
+                stat = entry.stat()
+                if now - stat.st_mtime > max_age:
+                    os.remove(entry.path)
+                    removed += 1
+                elif not entry.name.endswith('.tmp'):
+                    # a recent .tmp file is being written, an old one was left by a crashed writer
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            except FileNotFoundError:
+                pass
+
+        total = 0
+        for _, size, path in sorted(entries, reverse=True):
+            total += size
+            if total > max_bytes:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+    def report(self):
+        average = self.hit_time / self.hits * 1000 if self.hits else 0
+        line = 'object cache: {:d} hits ({:.2f} ms avg), {:d} misses'.format(self.hits, average, self.misses)
+        if self.write_errors:
+            line += ', {:d} not stored ({})'.format(self.write_errors, self.write_error)
+        return line
+
+
+class PersistentMemo(object):
+    """ Small mapping kept in a pickle file, with an expiry per entry,
+    dropping the least recently used entries beyond max_entries.
+    """
+
+    def __init__(self, path, max_entries=500):
+        self.path = path
+        self.max_entries = max_entries
+        # key -> (expires, value), least recently used first
+        self._entries = OrderedDict()
+        self._loaded = False
+        # keys put and keys found expired since the last save, the only ones save() writes to the file
+        self._changed = set()
+        self._expired = set()
+        self._lock = threading.Lock()
+
+    def _read(self):
+        try:
+            with open(self.path, 'rb') as fh:
+                return pickle.load(fh)
+        except Exception:
+            return OrderedDict()
+
+    def _load(self):
+        if not self._loaded:
+            self._loaded = True
+            self._entries = self._read()
+
+    def get(self, key):
+        with self._lock:
+            self._load()
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                del self._entries[key]
+                self._changed.discard(key)
+                self._expired.add(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, value, max_age):
+        with self._lock:
+            self._load()
+            self._entries[key] = (time.time() + max_age, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._changed.add(key)
+            self._expired.discard(key)
+
+    def save(self):
+        with self._lock:
+            if not self._changed and not self._expired:
+                return
+            # merge only what this instance changed into the file as it is now, other invocations may have
+            # saved newer entries for the other keys since we loaded it
+            entries = self._read()
+            now = time.time()
+            for key in self._expired:
+                if key in entries and entries[key][0] < now:
+                    del entries[key]
+            for key in self._changed:
+                if key in self._entries:
+                    entries.pop(key, None)
+                    entries[key] = self._entries[key]
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+            tmp = '{}.{:d}.tmp'.format(self.path, threading.get_ident())
+            with open(tmp, 'wb') as fh:
+                pickle.dump(entries, fh, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self.path)
+            self._entries = entries
+            self._changed.clear()
+            self._expired.clear()
+
+
+class SubtitleCache(object):
+    """ Converted subtitles, one directory per subtitle uri holding the file under the name kodi shows,
+    so replaying an episode does not download them again and plays never overwrite each other's files.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def file(self, uri, name):
+        directory = hashlib.sha1(uri.encode('utf-8')).hexdigest()
+        return os.path.join(self.path, directory, name + '.da.srt')
+
+    def get(self, uri, name):
+        """ :returns: the file of a cached subtitle, or None """
+        file = self.file(uri, name)
+        try:
+            # mtime is the last use, for the lru eviction in prune()
+            os.utime(file)
+        except OSError:
+            return None
+        return file
+
+    def put(self, uri, name, write):
+        """ Store a subtitle
+
+        :param write: function writing the srt to the text file handle it is given
+        :returns: the file of the subtitle
+        """
+        file = self.file(uri, name)
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        tmp = '{}.{:d}.tmp'.format(file, threading.get_ident())
+        try:
+            with open(tmp, 'w', encoding='utf-8', newline='') as fh:
+                write(fh)
+            os.replace(tmp, file)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        return file
+
+    def prune(self, max_age, max_bytes):
+        """ Remove subtitles not used for max_age seconds, then the least recently used until at most max_bytes are used
+
+        :returns: number of removed subtitles
+        """
+        if not os.path.exists(self.path):
+            return 0
+        now = time.time()
+        entries = []
+        removed = 0
+        for directory in os.scandir(self.path):
+            for entry in os.scandir(directory.path):
+                stat = entry.stat()
+                if now - stat.st_mtime > max_age:
+                    os.remove(entry.path)
+                    removed += 1
+                else:
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = 0
+        for _, size, path in sorted(entries, reverse=True):
+            total += size
+            if total > max_bytes:
+                os.remove(path)
+                removed += 1
+
+        for directory in os.scandir(self.path):
+            try:
+                os.rmdir(directory.path)
+            except OSError:
+                # not empty
+                pass
+        return removed
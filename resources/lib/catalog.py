@@ -0,0 +1,112 @@
+#
+#      Copyright (C) 2014 Tommy Winther, msj33, TermeHansen
+#
+#  https://github.com/xbmc-danish-addons/plugin.video.drnu
+#
+#  This Program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2, or (at your option)
+#  any later version.
+#
+#  This Program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this Program; see the file LICENSE.txt.  If not, write to
+#  the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
+#  http://www.gnu.org/copyleft/gpl.html
+#
+from bisect import bisect_left
+from operator import itemgetter
+import os
+import pickle
+import threading
+import time
+import unicodedata
+
+# æ, ø and å sort after z in danish
+DANISH_ORDER = str.maketrans({'æ': '{', 'ø': '|', 'å': '}'})
+
+
+def sort_key(title):
+    title = title.lower().translate(DANISH_ORDER)
+    # other accented letters sort with their base letter
+    return ''.join(c for c in unicodedata.normalize('NFKD', title) if not unicodedata.combining(c))
+
+
+def bounds(param):
+    """ Sort key range [low, high) for an A-Z parameter, a prefix like 'a' or a range like 'v..w' """
+    low, _, high = param.partition('..')
+    low = sort_key(low)
+    high = sort_key(high or low)
+    return low, high[:-1] + chr(ord(high[-1]) + 1)
+
+
+class SeriesCatalog(object):
+    """ Local copy of the series behind the A-Z indexes, kept sorted on title,
+    so a letter or range is found by bisection instead of asking the api.
+    """
+
+    def __init__(self, path, max_age=3600*24):
+        self.path = path
+        self.max_age = max_age
+        self.keys = []
+        self.items = []
+        # A-Z parameter -> time its series were last fetched
+        self.fetched = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _load(self, reload=False):
+        if self._loaded and not reload:
+            return
+        self._loaded = True
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'rb') as fh:
+                    self.keys, self.items, self.fetched = pickle.load(fh)
+            except Exception:
+                pass
+
+    def _save(self):
+        tmp = '{}.{:d}.tmp'.format(self.path, threading.get_ident())
+        with open(tmp, 'wb') as fh:
+            pickle.dump((self.keys, self.items, self.fetched), fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path)
+
+    def lookup(self, param):
+        """ :returns: the series for an A-Z parameter, or None if they have never been fetched """
+        with self._lock:
+            self._load()
+            if param not in self.fetched:
+                return None
+            low, high = bounds(param)
+            return self.items[bisect_left(self.keys, low):bisect_left(self.keys, high)]
+
+    def is_stale(self, param):
+        with self._lock:
+            self._load()
+            return time.time() - self.fetched.get(param, 0) > self.max_age
+
+    def update(self, param, items):
+        """ Replace the series for an A-Z parameter with items """
+        low, high = bounds(param)
+        entries = []
+        for item in items:
+            key = sort_key(item['SeriesTitle'])
+            if not low <= key < high:
+                # keep whatever the api put under this parameter inside its range
+                key = low + key
+            entries.append((key, item))
+        entries.sort(key=itemgetter(0))
+
+        with self._lock:
+            # another invocation may have updated other ranges meanwhile
+            self._load(reload=True)
+            start, end = bisect_left(self.keys, low), bisect_left(self.keys, high)
+            self.keys[start:end] = [key for key, _ in entries]
+            self.items[start:end] = [item for _, item in entries]
+            self.fetched[param] = time.time()
+            self._save()
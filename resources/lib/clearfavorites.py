@@ -38,9 +38,11 @@ CACHE_PATH = translatePath(ADDON.getAddonInfo("Profile"))
 if not os.path.exists(CACHE_PATH):
     os.makedirs(CACHE_PATH)
 
-FAVORITES_PATH = os.path.join(CACHE_PATH, 'favorites.pickle')
+# run as a script from resources/lib, so the addon itself is not on the path
+sys.path.insert(0, ADDON.getAddonInfo('path'))
+from resources.lib.store import LocalStore  # noqa: E402
 
-if os.path.exists(FAVORITES_PATH):
-    os.unlink(FAVORITES_PATH)
+# in the store, invocations running meanwhile see the favorites go away in one transaction
+LocalStore(os.path.join(CACHE_PATH, 'local.db')).clear_favorites()
 
 xbmcgui.Dialog().ok(ADDON.getLocalizedString(30008), ADDON.getLocalizedString(30202))
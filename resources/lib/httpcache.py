@@ -0,0 +1,95 @@
+#
+#      Copyright (C) 2014 Tommy Winther, msj33, TermeHansen
+#
+#  https://github.com/xbmc-danish-addons/plugin.video.drnu
+#
+#  This Program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2, or (at your option)
+#  any later version.
+#
+#  This Program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this Program; see the file LICENSE.txt.  If not, write to
+#  the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
+#  http://www.gnu.org/copyleft/gpl.html
+#
+from contextlib import closing
+import sqlite3
+import threading
+import time
+
+from requests_cache.backends.sqlite import DbCache
+
+
+class LruDbCache(DbCache):
+    """ sqlite cache backend that also remembers when each response was last used,
+    so the cache can be kept below a size quota by evicting the least recently used responses.
+    """
+
+    def __init__(self, location, **options):
+        super(LruDbCache, self).__init__(location, **options)
+        self.filename = self.responses.filename
+        # access times are collected in memory and written in one go by flush()
+        self._used = {}
+        self._lock = threading.Lock()
+        with closing(sqlite3.connect(self.filename)) as con:
+            con.execute("create table if not exists `access` (key PRIMARY KEY, used REAL)")
+            con.commit()
+
+    def save_response(self, key, response):
+        super(LruDbCache, self).save_response(key, response)
+        with self._lock:
+            self._used[key] = time.time()
+
+    def get_response_and_time(self, key, default=(None, None)):
+        response, timestamp = super(LruDbCache, self).get_response_and_time(key, default)
+        if response is not None:
+            with self._lock:
+                self._used[key] = time.time()
+        return response, timestamp
+
+    def flush(self):
+        with self._lock:
+            used, self._used = self._used, {}
+        if used:
+            with closing(sqlite3.connect(self.filename)) as con:
+                con.executemany("insert or replace into `access` (key, used) values (?, ?)", used.items())
+                con.commit()
+
+    def size(self):
+        with closing(sqlite3.connect(self.filename)) as con:
+            return con.execute("select coalesce(sum(length(value)), 0) from `responses`").fetchone()[0]
+
+    def enforce_quota(self, max_bytes):
+        """ Evict the least recently used responses until the cached responses take up at most max_bytes
+
+        :returns: number of evicted responses
+        """
+        self.flush()
+        with closing(sqlite3.connect(self.filename)) as con:
+            rows = con.execute("select r.key, length(r.value) from `responses` r left join `access` a on a.key = r.key "
+                               "order by coalesce(a.used, 0) desc").fetchall()
+
+        total = 0
+        evict = []
+        for key, size in rows:
+            total += size
+            if total > max_bytes:
+                evict.append(key)
+        if not evict:
+            return 0
+
+        for key in evict:
+            self.delete(key)
+        with closing(sqlite3.connect(self.filename)) as con:
+            con.execute("delete from `access` where key not in (select key from `responses`)")
+            con.execute("delete from `urls` where value not in (select key from `responses`)")
+            con.commit()
+            # give the space back to the filesystem
+            con.execute("vacuum")
+        return len(evict)
@@ -0,0 +1,180 @@
+#
+#      Copyright (C) 2014 Tommy Winther, msj33, TermeHansen
+#
+#  https://github.com/xbmc-danish-addons/plugin.video.drnu
+#
+#  This Program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2, or (at your option)
+#  any later version.
+#
+#  This Program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this Program; see the file LICENSE.txt.  If not, write to
+#  the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
+#  http://www.gnu.org/copyleft/gpl.html
+#
+from contextlib import contextmanager
+import json
+import os
+import threading
+import time
+
+# upper bounds in ms of the latency histogram buckets, the last bucket takes the rest
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+# where a result came from, fresh from one of the caches, stale from one of them or from the network
+SOURCES = ('object', 'http', 'stale', 'network')
+
+
+def new_entry():
+    return {'requests': 0, 'errors': 0, 'bytes': 0, 'sources': dict.fromkeys(SOURCES, 0),
+            'histogram': [0] * (len(BUCKETS) + 1)}
+
+
+def percentile(histogram, p):
+    """ :returns: upper bound in ms of the bucket holding the p-th percentile, None past the last bound """
+    total = sum(histogram)
+    if not total:
+        return 0
+    rank = p / 100.0 * total
+    count = 0
+    for i, n in enumerate(histogram):
+        count += n
+        if count >= rank:
+            return BUCKETS[i] if i < len(BUCKETS) else None
+    return None
+
+
+class Metrics(object):
+    """ Request counts, latencies, bytes, cache use and errors per endpoint, added up across invocations
+    in a json file. Invocations take turns updating it, see _file_lock.
+    """
+    # seconds save waits for another invocation's update, and after which a lock is taken as left by a crash
+    LOCK_TIMEOUT = 5
+    STALE_LOCK = 30
+
+    def __init__(self, path):
+        self.path = path
+        # endpoint -> entry, since the last save
+        self._current = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, seconds, source=None, size=0, error=False):
+        ms = seconds * 1000
+        with self._lock:
+            entry = self._current.setdefault(endpoint, new_entry())
+            entry['requests'] += 1
+            entry['bytes'] += size
+            if error:
+                entry['errors'] += 1
+            if source is not None:
+                entry['sources'][source] += 1
+            bucket = 0
+            while bucket < len(BUCKETS) and ms > BUCKETS[bucket]:
+                bucket += 1
+            entry['histogram'][bucket] += 1
+
+    def _read(self):
+        try:
+            with open(self.path) as fh:
+                return json.load(fh)
+        except Exception:
+            return {'since': time.time(), 'endpoints': {}}
+
+    @staticmethod
+    def _add(totals, endpoint, entry):
+        total = totals['endpoints'].setdefault(endpoint, new_entry())
+        for key in ('requests', 'errors', 'bytes'):
+            total[key] += entry[key]
+        for source in SOURCES:
+            total['sources'][source] += entry['sources'].get(source, 0)
+        total['histogram'] = [a + b for a, b in zip(total['histogram'], entry['histogram'])]
+
+    def totals(self):
+        """ :returns: {'since': time, 'endpoints': {endpoint: entry}} of the saved and current counts """
+        totals = self._read()
+        with self._lock:
+            for endpoint, entry in self._current.items():
+                self._add(totals, endpoint, entry)
+        return totals
+
+    @contextmanager
+    def _file_lock(self):
+        """ Held around reading and writing the file, so overlapping invocations do not lose each other's counts
+
+        :raises OSError: when another invocation holds it for more than LOCK_TIMEOUT seconds
+        """
+        lock = self.path + '.lock'
+        deadline = time.time() + self.LOCK_TIMEOUT
+        while True:
+            try:
+                os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(lock) > self.STALE_LOCK:
+                        os.remove(lock)
+                        continue
+                except FileNotFoundError:
+                    continue
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.01)
+        try:
+            yield
+        finally:
+            os.remove(lock)
+
+    def save(self):
+        with self._lock:
+            if not self._current:
+                return
+            current, self._current = self._current, {}
+        try:
+            with self._file_lock():
+                totals = self._read()
+                for endpoint, entry in current.items():
+                    self._add(totals, endpoint, entry)
+                tmp = '{}.{:d}.tmp'.format(self.path, threading.get_ident())
+                with open(tmp, 'w') as fh:
+                    json.dump(totals, fh)
+                os.replace(tmp, self.path)
+        except OSError:
+            # keep the counts for the next save
+            with self._lock:
+                restored = {'endpoints': self._current}
+                for endpoint, entry in current.items():
+                    self._add(restored, endpoint, entry)
+            raise
+
+    def reset(self):
+        with self._lock:
+            self._current = {}
+        with self._file_lock():
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def summary(self):
+        """ :returns: list of per endpoint dicts with the percentiles worked out, busiest endpoint first """
+        totals = self.totals()
+        rows = []
+        for endpoint, entry in totals['endpoints'].items():
+            row = {'endpoint': endpoint}
+            row.update((key, entry[key]) for key in ('requests', 'errors', 'bytes', 'sources'))
+            for p in (50, 95, 99):
+                row['p{:d}'.format(p)] = percentile(entry['histogram'], p)
+            row['histogram'] = dict(zip(['<={:d}ms'.format(bound) for bound in BUCKETS] + ['more'],
+                                        entry['histogram']))
+            rows.append(row)
+        rows.sort(key=lambda row: -row['requests'])
+        return rows
+
+    def export(self, path):
+        """ Write the summary as json to path """
+        with open(path, 'w') as fh:
+            json.dump({'since': self.totals()['since'], 'exported': time.time(), 'endpoints': self.summary()},
+                      fh, indent=2)
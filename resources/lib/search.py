@@ -0,0 +1,153 @@
+#
+#      Copyright (C) 2014 Tommy Winther, msj33, TermeHansen
+#
+#  https://github.com/xbmc-danish-addons/plugin.video.drnu
+#
+#  This Program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2, or (at your option)
+#  any later version.
+#
+#  This Program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this Program; see the file LICENSE.txt.  If not, write to
+#  the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
+#  http://www.gnu.org/copyleft/gpl.html
+#
+from bisect import bisect_left
+import os
+import pickle
+import re
+import threading
+import unicodedata
+
+# so 'ålborg' and 'aalborg', 'kø' and 'koe' find the same words
+DANISH_FOLD = str.maketrans({'æ': 'ae', 'ø': 'oe', 'å': 'aa'})
+# a word found in the title counts more than one found in the description
+WEIGHTS = {'title': 3, 'series': 2, 'description': 1}
+
+
+def normalize(text):
+    text = text.lower().translate(DANISH_FOLD)
+    text = ''.join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c))
+    return re.findall(r'\w+', text)
+
+
+class SearchIndex(object):
+    """ Inverted index over the series and episodes seen through the api, for searching without it.
+
+    Every word of the query has to match the start of a word in the document,
+    documents are ranked on the fields the words were found in, and on whole word matches.
+    """
+
+    def __init__(self, path, max_docs=10000):
+        self.path = path
+        self.max_docs = max_docs
+        # doc id -> (kind, item, words), in the order they were added
+        self.docs = {}
+        # word -> {doc id: weight}
+        self.postings = {}
+        self.words = []
+        self._loaded = False
+        self._dirty = False
+        self._lock = threading.RLock()
+
+    def _load(self, reload=False):
+        if self._loaded and not reload:
+            return
+        self._loaded = True
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'rb') as fh:
+                    self.docs, self.postings, self.words = pickle.load(fh)
+            except Exception:
+                pass
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            if self.words is None:
+                self.words = sorted(self.postings)
+            tmp = '{}.{:d}.tmp'.format(self.path, threading.get_ident())
+            with open(tmp, 'wb') as fh:
+                pickle.dump((self.docs, self.postings, self.words), fh, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self.path)
+            self._dirty = False
+
+    def refresh(self):
+        """ Pick up what other invocations have added, unless there are changes of our own to save first.
+        Call it once before a batch of add()
+        """
+        with self._lock:
+            if not self._dirty:
+                self._load(reload=True)
+
+    def add(self, doc_id, kind, item, fields, update=True):
+        """ Add or replace a document
+
+        :param kind: 'series' or 'episode'
+        :param item: what search() returns for the document
+        :param fields: {'title': ..., 'series': ..., 'description': ...} texts to index
+        :param update: replace a document whose item changed, when False it is only replaced if its words changed
+        """
+        weights = {}
+        for field, text in fields.items():
+            for word in normalize(text or ''):
+                weights[word] = max(weights.get(word, 0), WEIGHTS[field])
+
+        with self._lock:
+            self._load()
+            if doc_id in self.docs:
+                if self.docs[doc_id][1] == item or (not update and self.docs[doc_id][2] == tuple(weights)):
+                    return
+                self._remove(doc_id)
+
+            self.docs[doc_id] = (kind, item, tuple(weights))
+            for word, weight in weights.items():
+                self.postings.setdefault(word, {})[doc_id] = weight
+
+            while len(self.docs) > self.max_docs:
+                self._remove(next(iter(self.docs)))
+            self.words = None
+            self._dirty = True
+
+    def _remove(self, doc_id):
+        _, _, words = self.docs.pop(doc_id)
+        for word in words:
+            postings = self.postings[word]
+            del postings[doc_id]
+            if not postings:
+                del self.postings[word]
+
+    def search(self, query, kind, limit=75):
+        with self._lock:
+            self._load()
+            if self.words is None:
+                self.words = sorted(self.postings)
+
+            scores = None
+            for query_word in normalize(query):
+                word_scores = {}
+                for i in range(bisect_left(self.words, query_word), len(self.words)):
+                    word = self.words[i]
+                    if not word.startswith(query_word):
+                        break
+                    bonus = 2 if word == query_word else 1
+                    for doc_id, weight in self.postings[word].items():
+                        if weight * bonus > word_scores.get(doc_id, 0):
+                            word_scores[doc_id] = weight * bonus
+                if scores is None:
+                    scores = word_scores
+                else:
+                    scores = {doc_id: score + word_scores[doc_id] for doc_id, score in scores.items()
+                              if doc_id in word_scores}
+            if not scores:
+                return []
+
+            matches = sorted((-score, doc_id) for doc_id, score in scores.items() if self.docs[doc_id][0] == kind)
+            return [self.docs[doc_id][1] for _, doc_id in matches[:limit]]
@@ -0,0 +1,146 @@
+#
+#      Copyright (C) 2014 Tommy Winther, msj33, TermeHansen
+#
+#  https://github.com/xbmc-danish-addons/plugin.video.drnu
+#
+#  This Program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2, or (at your option)
+#  any later version.
+#
+#  This Program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this Program; see the file LICENSE.txt.  If not, write to
+#  the Free Software Foundation, 675 Mass Ave, Cambridge, MA 02139, USA.
+#  http://www.gnu.org/copyleft/gpl.html
+#
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+
+class LocalStore(object):
+    """ Favorites and recently watched episodes, with the snapshots they are shown from, in sqlite.
+
+    Every change is its own transaction on the row it concerns, and the database runs in WAL mode,
+    so simultaneous plugin invocations (and clearfavorites.py) read and write it safely.
+    """
+
+    def __init__(self, path, max_recent=25):
+        self.path = path
+        self.max_recent = max_recent
+        self._con = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._con is None:
+            self._con = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            self._con.execute("pragma journal_mode=wal")
+            with self._con:
+                self._con.execute("create table if not exists `favorites` "
+                                  "(key TEXT PRIMARY KEY, fetched REAL, items TEXT)")
+                self._con.execute("create table if not exists `recent` "
+                                  "(slug TEXT PRIMARY KEY, watched REAL, fetched REAL, item TEXT)")
+                self._con.execute("create index if not exists `recent_watched` on `recent` (watched)")
+            self._migrate()
+        return self._con
+
+    def _migrate(self):
+        # older versions kept the lists in pickle files
+        paths = {name: os.path.join(os.path.dirname(self.path), name + '.pickle')
+                 for name in ('favorites', 'recent', 'metadata')}
+        if not any(os.path.exists(path) for path in paths.values()):
+            return
+        loaded = {'favorites': [], 'recent': [], 'metadata': {'favorites': {}, 'recent': {}}}
+        for name, path in paths.items():
+            try:
+                with open(path, 'rb') as fh:
+                    loaded[name] = pickle.load(fh)
+            except Exception:
+                pass
+
+        now = time.time()
+        favorites, recent = loaded['metadata'].get('favorites', {}), loaded['metadata'].get('recent', {})
+        with self._con:
+            for key in loaded['favorites']:
+                meta = favorites.get(key)
+                self._con.execute("insert or ignore into `favorites` (key, fetched, items) values (?, ?, ?)",
+                                  (key, meta and meta['fetched'], meta and json.dumps(meta['items'])))
+            for i, slug in enumerate(loaded['recent'][:self.max_recent]):
+                meta = recent.get(slug)
+                self._con.execute("insert or ignore into `recent` (slug, watched, fetched, item) values (?, ?, ?, ?)",
+                                  (slug, now - i, meta and meta['fetched'], meta and json.dumps(meta['item'])))
+        for path in paths.values():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _read(self, sql, args=()):
+        with self._lock:
+            return self._connect().execute(sql, args).fetchall()
+
+    def _write(self, *statements):
+        """ Run (sql, args) statements in one transaction """
+        with self._lock:
+            con = self._connect()
+            with con:
+                for sql, args in statements:
+                    con.execute(sql, args)
+
+    def favorites(self):
+        """ :returns: the favorite keys in sorted order """
+        return [key for key, in self._read("select key from `favorites` order by key")]
+
+    def favorite_snapshots(self):
+        """ :returns: {key: {'fetched': time, 'items': series}} for the favorites that have been fetched """
+        return {key: {'fetched': fetched, 'items': json.loads(items)} for key, fetched, items in
+                self._read("select key, fetched, items from `favorites` where items is not null")}
+
+    def add_favorite(self, key):
+        self._write(("insert or ignore into `favorites` (key) values (?)", (key,)))
+
+    def remove_favorite(self, key):
+        self._write(("delete from `favorites` where key = ?", (key,)))
+
+    def clear_favorites(self):
+        self._write(("delete from `favorites`", ()))
+
+    def set_favorite_items(self, key, items):
+        # a favorite removed meanwhile stays removed
+        self._write(("update `favorites` set fetched = ?, items = ? where key = ?",
+                     (time.time(), json.dumps(items), key)))
+
+    def recent(self):
+        """ :returns: the recently watched slugs, the most recent first """
+        return [slug for slug, in self._read("select slug from `recent` order by watched desc")]
+
+    def recent_snapshots(self):
+        """ :returns: {slug: {'fetched': time, 'item': episode}} for the episodes that have been fetched """
+        return {slug: {'fetched': fetched, 'item': json.loads(item)} for slug, fetched, item in
+                self._read("select slug, fetched, item from `recent` where item is not null")}
+
+    def touch_recent(self, slug, item=None):
+        """ Make slug the most recently watched, keeping at most max_recent """
+        now = time.time()
+        statements = [("insert or ignore into `recent` (slug) values (?)", (slug,)),
+                      ("update `recent` set watched = ? where slug = ?", (now, slug))]
+        if item is not None:
+            statements.append(("update `recent` set fetched = ?, item = ? where slug = ?",
+                               (now, json.dumps(item), slug)))
+        statements.append(("delete from `recent` where slug not in "
+                           "(select slug from `recent` order by watched desc limit ?)", (self.max_recent,)))
+        self._write(*statements)
+
+    def remove_recent(self, slug):
+        self._write(("delete from `recent` where slug = ?", (slug,)))
+
+    def set_recent_item(self, slug, item):
+        self._write(("update `recent` set fetched = ?, item = ? where slug = ?", (time.time(), json.dumps(item), slug)))
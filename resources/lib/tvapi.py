@@ -20,43 +20,231 @@
 #
 
 import binascii
+import codecs
+from concurrent.futures import ThreadPoolExecutor, wait
+import datetime
+from functools import lru_cache
 import hashlib
+import io
 import json
 from math import ceil
 import os
 from pathlib import Path
 import re
-import requests
-import requests_cache
 import struct
+import threading
+import time
 import urllib.parse as urlparse
 
+from resources.lib.cache import ObjectCache, PersistentMemo, SubtitleCache
+from resources.lib.metrics import Metrics
+from resources.lib.catalog import SeriesCatalog
+from resources.lib.search import SearchIndex
+
+# fields kept when api items are stored locally, enough to list them without asking the api again
+SERIES_FIELDS = ('SeriesTitle', 'SeriesSlug', 'PrimaryImageUri')
+EPISODE_FIELDS = ('Title', 'Slug', 'SeriesSlug', 'PrimaryImageUri', 'Description', 'PrimaryBroadcastStartTime')
+
+
+def snapshot(item, fields):
+    meta = {field: item[field] for field in fields if field in item}
+    if (item.get('PrimaryAsset') or {}).get('Uri'):
+        meta['PrimaryAsset'] = {'Uri': item['PrimaryAsset']['Uri']}
+    return meta
+
+
+# fields of the api items kept by ItemRecord, besides the Uri of the PrimaryAsset
+RECORD_FIELDS = ('Title', 'SeriesTitle', 'SeriesSlug', 'Slug', 'PrimaryImageUri', 'Description',
+                 'PrimaryBroadcastStartTime')
+
+
+class ItemRecord(object):
+    """ The fields of an api item the listings use, in slots instead of the dict of the whole item.
+
+    Read like the item: record['Title'], 'Description' in record, record.get('PrimaryAsset', {}).get('Uri'),
+    a field the item did not have is missing here too.
+    """
+    __slots__ = RECORD_FIELDS + ('_assetUri',)
+    _fields = frozenset(RECORD_FIELDS)
+
+    def __init__(self, item):
+        for field in RECORD_FIELDS:
+            if field in item:
+                setattr(self, field, item[field])
+        asset = item.get('PrimaryAsset')
+        if asset is not None:
+            self._assetUri = asset.get('Uri')
+
+    def __getitem__(self, key):
+        try:
+            if key == 'PrimaryAsset':
+                return {'Uri': self._assetUri}
+            if key in self._fields:
+                return getattr(self, key)
+        except AttributeError:
+            pass
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        if key == 'PrimaryAsset':
+            return hasattr(self, '_assetUri')
+        return key in self._fields and hasattr(self, key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
 
 class Api():
     API_URL = 'http://www.dr.dk/mu-online/api/1.2'
-
-    def __init__(self, cachePath, getLocalizedString):
+    CACHE_MAINTENANCE_INTERVAL = 3600*12
+    # how long a resolved asset (stream uri and subtitle list) and a decrypted stream uri are remembered
+    ASSET_MAX_AGE = 3600*6
+    DECRYPTED_MAX_AGE = 3600*24*30
+    # converted subtitles, kept apart from the cache_size quota
+    SUBTITLE_MAX_AGE = 3600*24*14
+    SUBTITLE_CACHE_SIZE = 20*1024*1024
+    LIVE_CHANNELS_URL = '/channel/all-active-dr-tv-channels'
+    # seconds a search waits for the api before answering from the local search index, see _searchFirst
+    SEARCH_TIMEOUT = 1.5
+    # share of the channel list's time to live after which it is refreshed in the background
+    LIVE_REFRESH_AHEAD = 0.8
+    # budget for warming the caches for the items of a listing, see prefetch
+    PREFETCH_SECONDS = 10
+    PREFETCH_BYTES = 5*1024*1024
+    # (url pattern, seconds a response is fresh, seconds it may then be served stale while it is refreshed)
+    # the first pattern found in the url wins
+    CACHE_POLICY = (
+        ('/channel/', 60*5, 60*10),
+        ('/page/tv/programs', 60, 0),
+        ('/list/view/', 3600, 3600*8),
+        ('/programcard/', 3600*24*3, 3600*24*4),
+        ('/page/tv/themes', 3600*24*3, 3600*24*4),
+        ('', 3600*8, 3600*16),
+    )
+    # (url pattern, name the metrics are kept under), the first pattern found in the url wins,
+    # urls matching none are counted under their host
+    ENDPOINTS = (
+        ('/channel/', 'channels'),
+        ('/search/tv/programcards-latest-episode-with-asset/', 'series'),
+        ('/search/tv/programcards-with-asset/', 'search'),
+        ('/page/tv/themes', 'themes'),
+        # getLatestPrograms, the same page as getProgramIndexes in another order
+        ('orderBy=LastPrimaryBroadcastWithPublicAsset', 'latest'),
+        ('/page/tv/programs', 'programs'),
+        ('/list/view/', 'views'),
+        ('/list/', 'lists'),
+        ('/programcard/', 'programcard'),
+        ('/manifest/', 'manifest'),
+    )
+
+    def __init__(self, cachePath, getLocalizedString, pool_size=10, pool_hosts=4, workers=4,
+                 cache_size=50*1024*1024, api_url=None, record=None):
         self.cachePath = cachePath
         self.tr = getLocalizedString
-
-        # cache expires after: 3600 = 1hour
-        requests_cache.install_cache(os.path.join(
-            cachePath, 'requests.cache'), backend='sqlite', expire_after=3600*8)
-        requests_cache.remove_expired_responses()
-        self.empty_srt = f'{self.cachePath}/{self.tr(30508)}.da.srt'
-
-        # we need to have something in the srt to make kodi use it
-        Path(self.empty_srt).write_text('1\n00:00:00,000 --> 00:01:01,000\n')
+        if api_url:
+            # e.g. benchmarks/fixture_server.py standing in for the api
+            self.API_URL = api_url.rstrip('/')
+        # file the responses fetched by _http_request are appended to, for replaying them
+        self.record = record
+        self._recordLock = threading.Lock()
+        self.workers = workers
+        # set on the threads of concurrent_map, whose funcs must not start pools of their own
+        self._worker = threading.local()
+        self.cache_size = cache_size
+        self.deferred = []
+        self._revalidating = set()
+        # bytes downloaded by this instance, and where the api results came from,
+        # approximate as the threads do not lock for them
+        self.received = 0
+        self.apiCalls = 0
+        self.networkCalls = 0
+        self.objectHits = 0
+        self.httpCacheHits = 0
+
+        self._pool = (pool_size, pool_hosts)
+        self._session = None
+        self._sessionLock = threading.Lock()
+        self.objects = ObjectCache(os.path.join(cachePath, 'objects'))
+        self.catalog = SeriesCatalog(os.path.join(cachePath, 'catalog.pickle'))
+        self.searchIndex = SearchIndex(os.path.join(cachePath, 'search.pickle'))
+        self.streams = PersistentMemo(os.path.join(cachePath, 'streams.pickle'))
+        self.subtitles = SubtitleCache(os.path.join(cachePath, 'subtitles'))
+        self.metrics = Metrics(os.path.join(cachePath, 'metrics.json'))
+        self._pendingIndex = []
+        self._indexLock = threading.Lock()
+        self.defer(self.maintainCache)
+
+    @property
+    def session(self):
+        # requests and the sqlite cache are only loaded by the routes that use the network
+        with self._sessionLock:
+            if self._session is None:
+                self._session = self._create_session(*self._pool)
+            return self._session
+
+    @property
+    def empty_srt(self):
+        empty_srt = f'{self.cachePath}/{self.tr(30508)}.da.srt'
+        if not os.path.exists(empty_srt):
+            # we need to have something in the srt to make kodi use it
+            Path(empty_srt).write_text('1\n00:00:00,000 --> 00:01:01,000\n')
+        return empty_srt
 
     def getLiveTV(self):
-        channels = self._http_request('/channel/all-active-dr-tv-channels')
+        channels = self._http_request(self.LIVE_CHANNELS_URL)
         return [channel for channel in channels if channel['Title'] in ['DR1', 'DR2', 'DR Ramasjang']]
 
+    def getLiveChannels(self):
+        """ Live channels by slug, each with 'Streams': {link type: stream url} for the HLS link types
+
+        Kept for the lifetime of the channel list in the cache, and refreshed after the listing
+        once LIVE_REFRESH_AHEAD of it has passed, so zapping does not wait for the api.
+        """
+        registry = self.streams.get(('channels', self.API_URL))
+        if registry is None:
+            return self._updateLiveChannels()
+        url = self.API_URL + self.LIVE_CHANNELS_URL
+        ttl, _ = self.cache_policy(url)
+        if time.time() - registry['fetched'] > ttl * self.LIVE_REFRESH_AHEAD and url not in self._revalidating:
+            self._revalidating.add(url)
+            self.defer(self._updateLiveChannels, True)
+        return registry['channels']
+
+    def _updateLiveChannels(self, revalidate=False):
+        url = self.API_URL + self.LIVE_CHANNELS_URL
+        if revalidate:
+            self._revalidate(url)
+        channels = {}
+        for channel in self.getLiveTV():
+            channel['Streams'] = {}
+            for server in channel['StreamingServers']:
+                if server['LinkType'] in ('HLS', 'HLS_subtitles'):
+                    channel['Streams'].setdefault(
+                        server['LinkType'], server['Server'] + '/' + server['Qualities'][0]['Streams'][0]['Stream'])
+            channels[channel['Slug']] = channel
+
+        # as old as the channel list it was made from
+        hit = self.objects.get(self.objects.key(url))
+        registry = {'fetched': hit[0] if hit else time.time(), 'channels': channels}
+        ttl, stale = self.cache_policy(url)
+        self.streams.put(('channels', self.API_URL), registry, ttl + stale)
+        self.defer(self.streams.save)
+        return channels
+
     def getChildrenFrontItems(self, channel):
         new = f"/search/tv/programcards-latest-episode-with-asset/series-title-starts-with/?channels={channel}&orderBy=Title"
         childrenFront = self._http_request(self.API_URL + new)
         return self._handle_paging(childrenFront)
 
+    def getChildrenFrontPage(self, channel, offset, limit):
+        """ :returns: (items, offset of the next page or None), a page of getChildrenFrontItems """
+        url = self.API_URL + "/search/tv/programcards-latest-episode-with-asset/series-title-starts-with/"
+        result = self._http_request(url, self._page_params({'channels': channel, 'orderBy': 'Title'}, offset, limit))
+        return [ItemRecord(item) for item in result['Items']], self._next_offset(result, offset)
+
     def getThemes(self):
         themes = self._http_request('/page/tv/themes', {'themenamesonly': 'false'})
         return themes['Themes']
@@ -67,7 +255,8 @@ class Api():
             'orderBy': 'LastPrimaryBroadcastWithPublicAsset',
             'orderDescending': 'true',
             'channel': channel
-        }, cache=False)
+        })
+        self.indexItems(result['Programs']['Items'])
         return result['Programs']['Items']
 
     def getProgramIndexes(self):
@@ -110,91 +299,468 @@ class Api():
         ]
 
     def searchProgram(self, query, limit=75):
+        def local():
+            items = self.searchIndex.search(query, 'episode', limit)
+            return {'Items': items, 'Paging': {}, 'TotalSize': len(items)} if items else None
+        return self._searchFirst(self._searchProgram, local, query, limit)
+
+    def _searchProgram(self, query, limit, timeout=30):
         # Remove various characters that makes the API puke
         cleaned_query = re.sub(r'[&()"\'\.!]', '', query)
         params = {'limit': limit}
-        result = self._http_request(f'/search/tv/programcards-with-asset/title/{cleaned_query}', params=params)
+        result = self._http_request(f'/search/tv/programcards-with-asset/title/{cleaned_query}', params=params,
+                                    timeout=timeout)
+        self.indexItems(result['Items'])
         return result
 
-    def searchSeries(self, query, startswith=False, limit=75):
+    def searchSeries(self, query, startswith=False, limit=75, fallback=True):
+        """ :param fallback: answer from the local search index when the api does not answer within SEARCH_TIMEOUT """
+        if not fallback or startswith:
+            return self._searchSeries(query, startswith, limit)
+        return self._searchFirst(self._searchSeries, lambda: self.searchIndex.search(query, 'series', limit),
+                                 query, startswith, limit)
+
+    def _searchSeries(self, query, startswith, limit, timeout=30):
         base = '/search/tv/programcards-latest-episode-with-asset/series-title'
         if startswith:
             base += '-starts-with'
         else:
             # Remove various characters that makes the API puke
             query = re.sub(r'[&()"\'\.!]', '', query)
-        result = self._http_request(f'{base}/{query}', params={'limit': limit})
-        return self._handle_paging(result)
+        result = self._http_request(f'{base}/{query}', params={'limit': limit}, timeout=timeout)
+        items = self._handle_paging(result)
+        self.indexItems(items)
+        return items
+
+    def _searchFirst(self, search, local, *args):
+        """ Ask the api, but answer from the local search index when it does not answer within SEARCH_TIMEOUT
+
+        :param search: function asking the api, taking args and a timeout
+        :param local: function returning the hits in the local index, None or empty if there are none
+        """
+        try:
+            return search(*args, timeout=self.SEARCH_TIMEOUT)
+        except ApiException:
+            result = local()
+            if not result:
+                # nothing to answer with but the api, give it the time any other request gets
+                return search(*args)
+            # the index only knows what has been listed before, the api results are for the next search
+            self.defer(search, *args)
+            return result
+
+    def getSeriesByLetter(self, param):
+        # answered from the local catalog, the api is only asked for ranges never seen before
+        items = self.catalog.lookup(param)
+        if items is None:
+            items = self._fetchSeriesByLetter(param)
+        elif self.catalog.is_stale(param):
+            self.defer(self._fetchSeriesByLetter, param)
+        return items
+
+    def refreshCatalog(self, params, limit=2):
+        # fill in the catalog a few ranges at a time, missing ones first
+        params = sorted((param for param in params if self.catalog.is_stale(param)),
+                        key=lambda param: self.catalog.lookup(param) is not None)
+        for param in params[:limit]:
+            self._fetchSeriesByLetter(param)
+
+    def _fetchSeriesByLetter(self, param):
+        items = self.searchSeries(param, startswith=True)
+        self.catalog.update(param, [snapshot(item, SERIES_FIELDS) for item in items])
+        return items
 
     def getEpisodes(self, slug):
         result = self._http_request(f'/list/{slug}', {'limit': 75, 'expanded': True})
-        return self._handle_paging(result)
+        items = self._handle_paging(result)
+        self.indexItems(items)
+        return items
+
+    def getEpisodesPage(self, slug, offset, limit):
+        """ :returns: (items, offset of the next page or None), a page of getEpisodes """
+        result = self._http_request(f'/list/{slug}', self._page_params({'expanded': True}, offset, limit))
+        items = [ItemRecord(item) for item in result['Items']]
+        self.indexItems(items)
+        return items, self._next_offset(result, offset)
+
+    @staticmethod
+    def _page_params(params, offset, limit):
+        params = dict(limit=limit, **params)
+        if offset:
+            # the first page has no offset, so when limit is 75, the default paging.size, it is cached as the
+            # one getEpisodes starts from; other sizes have their own cache entries
+            params['offset'] = offset
+        return params
+
+    @staticmethod
+    def _next_offset(result, offset):
+        next_url = result['Paging'].get('Next')
+        if next_url is None or not result['Items']:
+            return None
+        match = re.search(r'[?&]offset=(\d+)', next_url)
+        return int(match.group(1)) if match else offset + len(result['Items'])
 
     def getEpisode(self, slug):
-        return self._http_request(f'/programcard/{slug}')
+        item = self._http_request(f'/programcard/{slug}')
+        self.indexItems([item])
+        return item
 
     def getMostViewed(self):
         result = self._http_request('/list/view/mostviewed', {'limit': 48})
+        self.indexItems(result['Items'])
         return result['Items']
 
     def getSelectedList(self):
         result = self._http_request('/list/view/selectedlist',
                                     {'limit': 60})
+        self.indexItems(result['Items'])
         return result['Items']
 
-    def getVideoUrl(self, assetUri):
-        result = self._http_request(assetUri)
+    def indexItems(self, items):
+        # program cards are added to the search index after the listing, see _flushIndex
+        with self._indexLock:
+            if not self._pendingIndex:
+                self.defer(self._flushIndex)
+            self._pendingIndex.append(items)
+
+    def _flushIndex(self):
+        with self._indexLock:
+            pending, self._pendingIndex = self._pendingIndex, []
+        self.searchIndex.refresh()
+        series = set()
+        for items in pending:
+            for item in items:
+                # the episodes of a series differ in image and asset, so the series is taken from its first one,
+                # and not replaced for those alone
+                if item.get('SeriesSlug') and item.get('SeriesTitle') and item['SeriesSlug'] not in series:
+                    series.add(item['SeriesSlug'])
+                    self.searchIndex.add('series:' + item['SeriesSlug'], 'series', snapshot(item, SERIES_FIELDS),
+                                         {'title': item['SeriesTitle']}, update=False)
+                if item.get('Slug') and item.get('Title'):
+                    self.searchIndex.add('episode:' + item['Slug'], 'episode', snapshot(item, EPISODE_FIELDS),
+                                         {'title': item['Title'], 'series': item.get('SeriesTitle'),
+                                          'description': item.get('Description')})
+        self.searchIndex.save()
+
+    def getAsset(self, assetUri):
+        # remembered, so replays and resumes need neither the manifest nor the decryption
+        asset = self.streams.get(('asset', assetUri))
+        if asset is not None:
+            return asset
 
+        result = self._http_request(assetUri)
         uri = None
         for link in result['Links']:
             if link['Target'] == 'HLS':
                 uri = link['Uri']
                 if uri is None:
-                    uri = link['EncryptedUri']
-                    uri = decrypt_uri(uri)
+                    uri = self.decryptUri(link['EncryptedUri'])
                 break
 
-        subtitlesUri = None
-        if 'SubtitlesList' in result and len(result['SubtitlesList']) > 0:
-            subtitlesUri = []
-            foreign = False
-            for sub in result['SubtitlesList']:
-                if 'HardOfHearing' in sub['Type']:
-                    name = f'{self.cachePath}/{self.tr(30506)}.da.srt'
-                else:
-                    foreign = True
-                    name = f'{self.cachePath}/{self.tr(30507)}.da.srt'
-                u = requests.get(sub['Uri'], timeout=10)
-                if u.status_code != 200:
-                    u.close()
-                    break
-                srt = self.vtt2srt(u.content)
-                with open(name.encode('utf-8'), 'wb') as fh:
-                    fh.write(srt.encode('utf-8'))
-                u.close()
-                subtitlesUri.append(name)
-            if not foreign:
-                # no subtitles, so probably all danish, so we need to set an empty subtitle file as first choice
-                subtitlesUri = [self.empty_srt] + subtitlesUri
-        return {
+        asset = {
             'Uri': uri,
-            'SubtitlesUri': subtitlesUri
+            'SubtitlesList': [{'Type': sub['Type'], 'Uri': sub['Uri']} for sub in result.get('SubtitlesList') or []]
+        }
+        if uri is not None:
+            self.streams.put(('asset', assetUri), asset, self.ASSET_MAX_AGE)
+            self.defer(self.streams.save)
+        return asset
+
+    def decryptUri(self, encryptedUri):
+        uri = self.streams.get(('encrypted', encryptedUri))
+        if uri is None:
+            uri = decrypt_uri(encryptedUri)
+            self.streams.put(('encrypted', encryptedUri), uri, self.DECRYPTED_MAX_AGE)
+            self.defer(self.streams.save)
+        return uri
+
+    def getVideoUrl(self, assetUri, timeout=None):
+        result = self.getAsset(assetUri)
+        return {
+            'Uri': result['Uri'],
+            'SubtitlesUri': self.getSubtitles(result['SubtitlesList'], timeout)
         }
 
+    def getSubtitles(self, subtitlesList, timeout=None):
+        """ Converted subtitle files for the SubtitlesList of an asset, fetched concurrently
+
+        Tracks not ready within timeout seconds are left out, they are still stored for the next play.
+        """
+        if len(subtitlesList) == 0:
+            return None
+        # one at a time when prefetch already runs this on each of its threads
+        workers = 1 if self._onWorker() else min(self.workers, len(subtitlesList))
+        executor = ThreadPoolExecutor(max_workers=workers)
+        futures = [executor.submit(self._subtitleFile, sub) for sub in subtitlesList]
+        # do not wait for the late ones here
+        executor.shutdown(wait=False)
+        done, _ = wait(futures, timeout)
+
+        subtitlesUri = []
+        foreign = False
+        for sub, future in zip(subtitlesList, futures):
+            if 'HardOfHearing' not in sub['Type']:
+                foreign = True
+            if future not in done:
+                continue
+            if future.exception() is not None or future.result() is None:
+                break
+            subtitlesUri.append(future.result())
+        if not foreign:
+            # no subtitles, so probably all danish, so we need to set an empty subtitle file as first choice
+            subtitlesUri = [self.empty_srt] + subtitlesUri
+        return subtitlesUri
+
+    def _subtitleFile(self, sub):
+        import requests
+        name = self.tr(30506) if 'HardOfHearing' in sub['Type'] else self.tr(30507)
+        start = time.perf_counter()
+        cached = self.subtitles.get(sub['Uri'], name)
+        if cached:
+            # the converted file is the subtitles' object cache
+            self.metrics.record('subtitles', time.perf_counter() - start, 'object')
+            return cached
+
+        # past the http cache, the converted subtitle is what is kept
+        received = [0]
+        failed = True
+        try:
+            request = self.session.prepare_request(requests.Request('GET', sub['Uri']))
+            u = requests.Session.send(self.session, request, timeout=10, stream=True)
+            try:
+                if u.status_code != 200:
+                    return None
+                file = self.subtitles.put(
+                    sub['Uri'], name,
+                    lambda fh: write_srt(vtt_lines(self._counted(u.iter_content(16384), received)), fh.write))
+                failed = False
+                return file
+            finally:
+                u.close()
+        finally:
+            self.metrics.record('subtitles', time.perf_counter() - start, 'network', received[0], error=failed)
+
+    def _counted(self, chunks, received):
+        for chunk in chunks:
+            self.received += len(chunk)
+            received[0] += len(chunk)
+            yield chunk
+
+    def isResolved(self, assetUri):
+        return self.streams.get(('asset', assetUri)) is not None
+
+    def takePrefetched(self, assetUri):
+        """ :returns: whether prefetch resolved assetUri, only once, later plays are replays """
+        if self.streams.get(('prefetched', assetUri)) is None:
+            return False
+        self.streams.put(('prefetched', assetUri), None, 0)
+        self.defer(self.streams.save)
+        return True
+
+    def prefetch(self, items, count):
+        """ Resolve the first count playable items, so playing them needs neither the api nor subtitle downloads
+
+        Stops starting items after PREFETCH_SECONDS or once PREFETCH_BYTES have been downloaded.
+        :returns: number of items resolved
+        """
+        deadline = time.time() + self.PREFETCH_SECONDS
+        budget = self.received + self.PREFETCH_BYTES
+        slugs = [item['Slug'] for item in items if (item.get('PrimaryAsset') or {}).get('Uri')][:count]
+
+        def resolve(slug):
+            if time.time() > deadline or self.received > budget:
+                return False
+            try:
+                # what playVideo asks for
+                episode = self.getEpisode(slug)
+                if 'PrimaryAsset' in episode:
+                    assetUri = episode['PrimaryAsset']['Uri']
+                    resolved = self.isResolved(assetUri)
+                    self.getVideoUrl(assetUri)
+                    if not resolved:
+                        # for telling the plays prefetching sped up from replays, see takePrefetched
+                        self.streams.put(('prefetched', assetUri), True, self.ASSET_MAX_AGE)
+                        self.defer(self.streams.save)
+            except (ApiException, IOError):
+                return False
+            return True
+
+        return sum(self.concurrent_map(resolve, slugs))
+
     def redirectImageUrl(self, imageUrl, width=300, height=170):
         # HACK: the servers behind /mu-online/api/1.2 is often returning Content-Type="text/xml"
         # instead of "image/jpeg", this problem is not pressent for /mu/bar (the "Classic API")
-        assert(self.api.API_URL.endswith("/mu-online/api/1.2"))
+        assert(self.API_URL.endswith("/mu-online/api/1.2"))
         return imageUrl.replace("/mu-online/api/1.2/bar/", "/mu/bar/") + "?width={:d}&height={:d}".format(width, height)
 
+    def imageArt(self, sizes):
+        """ :returns: function making the art of an image url, redirectImageUrl for each {art: (width, height)} """
+        assert(self.API_URL.endswith("/mu-online/api/1.2"))
+        suffixes = [(art, "?width={:d}&height={:d}".format(width, height)) for art, (width, height) in sizes.items()]
+
+        def art(imageUrl):
+            imageUrl = imageUrl.replace("/mu-online/api/1.2/bar/", "/mu/bar/")
+            return {art: imageUrl + suffix for art, suffix in suffixes}
+        return art
+
+    def _create_session(self, pool_size, pool_hosts):
+        import requests
+        import requests_cache
+        from resources.lib.httpcache import LruDbCache
+
+        # expiry is handled per endpoint by _cached_response, see CACHE_POLICY
+        backend = LruDbCache(os.path.join(self.cachePath, 'requests.cache'))
+        session = requests_cache.CachedSession(backend=backend, expire_after=None)
+
+        # keep up to pool_size connections alive per host, for up to pool_hosts hosts
+        # (api, assets, subtitles), so a browse session only pays one handshake per host
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_hosts, pool_maxsize=pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers['Connection'] = 'keep-alive'
+        return session
+
+    def defer(self, func, *args):
+        # queue work that should not hold up the listing, see runDeferred
+        self.deferred.append((func, args))
+
+    def runDeferred(self):
+        errors = []
+        while self.deferred:
+            func, args = self.deferred.pop(0)
+            try:
+                func(*args)
+            except Exception as ex:
+                errors.append(ex)
+        if self._session is not None:
+            # last, so responses saved by the deferred revalidations and prefetches get their use time too
+            try:
+                self._session.cache.flush()
+            except Exception as ex:
+                errors.append(ex)
+        return errors
+
+    def maintainCache(self, force=False):
+        # pruning scans the whole cache, so only do it once per interval
+        stamp = os.path.join(self.cachePath, 'requests.cache.maintained')
+        if not force and os.path.exists(stamp) and \
+                time.time() - os.path.getmtime(stamp) < self.CACHE_MAINTENANCE_INTERVAL:
+            return
+
+        # touch first, so simultaneous invocations do not start it as well
+        Path(stamp).touch()
+        max_age = max(ttl + stale for _, ttl, stale in self.CACHE_POLICY)
+        self.session.cache.remove_old_entries(datetime.datetime.utcnow() - datetime.timedelta(seconds=max_age))
+        # the quota is shared between the responses and the decoded objects
+        self.session.cache.enforce_quota(self.cache_size // 2)
+        self.objects.prune(max_age, self.cache_size // 2)
+        self.subtitles.prune(self.SUBTITLE_MAX_AGE, self.SUBTITLE_CACHE_SIZE)
+
+    def cache_policy(self, url):
+        for pattern, ttl, stale in self.CACHE_POLICY:
+            if pattern in url:
+                return ttl, stale
+
+    def endpoint(self, url):
+        for pattern, name in self.ENDPOINTS:
+            if pattern in url:
+                return name
+        return urlparse.urlsplit(url).netloc
+
+    def _freshness(self, url, fetched):
+        """ :returns: 'fresh', 'stale' or 'expired' for a copy of url fetched at the time fetched """
+        ttl, stale = self.cache_policy(url)
+        age = time.time() - fetched
+        if age < ttl:
+            return 'fresh'
+        if age < ttl + stale:
+            return 'stale'
+        return 'expired'
+
+    def _usable(self, url, fetched):
+        freshness = self._freshness(url, fetched)
+        if freshness == 'stale':
+            # serve the stale copy right away, and refresh it after the listing
+            if url not in self._revalidating:
+                self._revalidating.add(url)
+                self.defer(self._revalidate, url)
+        return freshness != 'expired'
+
+    def _cached_response(self, url):
+        cache = self.session.cache
+        key = self._cache_key(url)
+        response, timestamp = cache.get_response_and_time(key)
+        if response is None:
+            return None, None
+
+        fetched = timestamp.replace(tzinfo=datetime.timezone.utc).timestamp()
+        if self._usable(url, fetched):
+            return response, fetched
+        cache.delete(key)
+        return None, None
+
+    def _cache_key(self, url):
+        import requests
+        return self.session.cache.create_key(self.session.prepare_request(requests.Request('GET', url)))
+
+    def _revalidate(self, url):
+        # keep the stale copy unless a new one could be fetched
+        with self.session.cache_disabled():
+            u = self.session.get(url, timeout=30)
+        if u.status_code == 200:
+            self.session.cache.save_response(self._cache_key(url), u)
+            self.objects.put(self.objects.key(url), time.time(), json.loads(u.text))
+        u.close()
+
     def _handle_paging(self, result):
-        items = result['Items']
+        # only what the listings use is kept of each page, see ItemRecord
+        items = [ItemRecord(item) for item in result['Items']]
+        if 'Next' not in result['Paging']:
+            return items
+
+        for result in self.concurrent_map(self._http_request, self._page_urls(result)):
+            items.extend(map(ItemRecord, result['Items']))
+
+        # without a total we have to chain the pages, this also picks up pages added since the first response
         while 'Next' in result['Paging']:
             result = self._http_request(result['Paging']['Next'])
-            items.extend(result['Items'])
+            items.extend(map(ItemRecord, result['Items']))
         return items
 
-    def _http_request(self, url, params=None, cache=True):
+    def concurrent_map(self, func, items):
+        # run func over items on a pool of at most self.workers threads, results keep the order of items
+        items = list(items)
+        if len(items) < 2 or self._onWorker():
+            # nested, e.g. the paging of searchSeries run by refreshFavorites, the outer pool keeps the bound
+            return [func(item) for item in items]
+
+        def run(item):
+            self._worker.active = True
+            return func(item)
+
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(items))) as executor:
+            return list(executor.map(run, items))
+
+    def _onWorker(self):
+        """ :returns: whether this runs on a thread of concurrent_map """
+        return getattr(self._worker, 'active', False)
+
+    def _page_urls(self, result):
+        # work out the urls of the remaining pages from the paging metadata of the first page
+        total = result.get('TotalSize', result['Paging'].get('TotalSize'))
+        next_url = result['Paging']['Next']
+        offset = re.search(r'[?&]offset=(\d+)', next_url)
+        limit = re.search(r'[?&]limit=(\d+)', next_url)
+        if total is None or offset is None or limit is None or int(limit.group(1)) == 0:
+            return []
+
+        return [next_url[:offset.start(1)] + str(page_offset) + next_url[offset.end(1):]
+                for page_offset in range(int(offset.group(1)), int(total), int(limit.group(1)))]
+
+    def _http_request(self, url, params=None, timeout=30):
+        start = time.perf_counter()
+        source = None
+        size = 0
         try:
             if not url.startswith(('http://', 'https://')):
                 url = self.API_URL + urlparse.quote(url, '/')
@@ -202,39 +768,154 @@ class Api():
             if params:
                 url += '?' + urlparse.urlencode(params, doseq=True)
 
-            if not cache:
-                with requests_cache.disabled():
-                    u = requests.get(url, timeout=30)
+            self.apiCalls += 1
+            key = self.objects.key(url)
+            hit = self.objects.get(key)
+            if hit is not None and self._usable(url, hit[0]):
+                self.objectHits += 1
+                source = 'object' if self._freshness(url, hit[0]) == 'fresh' else 'stale'
+                self.metrics.record(self.endpoint(url), time.perf_counter() - start, source)
+                return hit[1]
+
+            u, fetched = self._cached_response(url)
+            if u is None:
+                u = self.session.get(url, timeout=timeout)
+                fetched = time.time()
+                if self.record:
+                    self._record(url, u)
+                self.networkCalls += 1
+                source = 'network'
+                size = len(u.content)
+                self.received += size
             else:
-                u = requests.get(url, timeout=30)
+                self.httpCacheHits += 1
+                source = 'http' if self._freshness(url, fetched) == 'fresh' else 'stale'
             if u.status_code == 200:
                 content = u.text
                 u.close()
             else:
                 raise ApiException(u.text)
 
-            return json.loads(content)
+            result = json.loads(content)
+            # best effort, a failed write does not fail the request, see ObjectCache.put
+            self.objects.put(key, fetched, result)
+            self.metrics.record(self.endpoint(url), time.perf_counter() - start, source, size)
+            return result
         except Exception as ex:
+            self.metrics.record(self.endpoint(url), time.perf_counter() - start, source, size, error=True)
             raise ApiException(ex)
 
+    def _record(self, url, response):
+        # one json line per response, see benchmarks/fixture_server.py --replay
+        line = json.dumps({'url': url, 'status': response.status_code,
+                           'content_type': response.headers.get('Content-Type', ''), 'body': response.text})
+        with self._recordLock:
+            with open(self.record, 'a', encoding='utf-8') as fh:
+                fh.write(line + '\n')
+
     def vtt2srt(self, vtt):
-        if isinstance(vtt, bytes):
-            vtt = vtt.decode('utf-8')
-        srt = vtt.replace("\r\n", "\n")
-        srt = re.sub(r'([\d]+)\.([\d]+)', r'\1,\2', srt)
-        srt = re.sub(r'WEBVTT\n\n', '', srt)
-        srt = re.sub(r'^\d+\n', '', srt)
-        srt = re.sub(r'\n\d+\n', '\n', srt)
-        srt = re.sub(r'\n([\d]+)', r'\nputINDEXhere\n\1', srt)
-
-        srtout = ['1']
-        idx = 2
-        for line in srt.splitlines():
-            if line == 'putINDEXhere':
-                line = str(idx)
-                idx += 1
-            srtout.append(line)
-        return '\n'.join(srtout)
+        srt = io.StringIO()
+        write_srt(vtt_lines([vtt]), srt.write)
+        return srt.getvalue()
+
+
+# characters str.splitlines() splits on, besides \n
+LINE_BOUNDARIES = re.compile('[\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]')
+
+
+def decimal_commas(text):
+    r""" re.sub(r'([\d]+)\.([\d]+)', r'\1,\2', text), without a match object per timestamp """
+    pieces = text.split('.')
+    out = [pieces[0]]
+    replaced = False
+    for before, after in zip(pieces, pieces[1:]):
+        # digits that ended the previous match can not start another one
+        replaced = before[-1:].isdecimal() and after[:1].isdecimal() and not (replaced and before.isdecimal())
+        out.append(',' if replaced else '.')
+        out.append(after)
+    return ''.join(out)
+
+
+def srt_text(text):
+    """ The substitutions made on whole lines of WebVTT before cues are renumbered """
+    return decimal_commas(text.replace('\r\n', '\n')).replace('WEBVTT\n\n', '')
+
+
+def vtt_lines(chunks):
+    """
+    Split WebVTT text into lines, decoding as it goes
+    @param {iterable} chunks  bytes or str
+    @returns {generator}      (line, terminated) after srt_text()
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    # raw text of the unfinished line, and what is left of the last converted one
+    rest = ''
+    carry = ''
+    for chunk in chunks:
+        if isinstance(chunk, bytes):
+            chunk = decoder.decode(chunk)
+        text = rest + chunk
+        end = text.rfind('\n') + 1
+        if text.endswith(('WEBVTT\n', 'WEBVTT\r\n'), 0, end):
+            # the blank line that drops it may come with the next chunk
+            end = text.rfind('\n', 0, end - 1) + 1
+        if end:
+            lines = (carry + srt_text(text[:end])).split('\n')
+            carry = lines.pop()
+            rest = text[end:]
+            for line in lines:
+                yield line, True
+        else:
+            rest = text
+    lines = (carry + srt_text(rest + decoder.decode(b'', final=True))).split('\n')
+    last = lines.pop()
+    for line in lines:
+        yield line, True
+    yield last, False
+
+
+def write_srt(lines, write):
+    """
+    Convert WebVTT lines to srt in one pass, renumbering the cues
+    @param {iterable} lines   (line, terminated) as from vtt_lines
+    @param {function} write   called with the srt text, piece by piece
+    """
+    index = 2
+    head = True
+    first = True
+    cue_id_removed = False
+    write('1')
+    for line, terminated in lines:
+        if head:
+            head = False
+            if terminated and line.isdecimal():
+                # a cue id on the very first line, the next line is then the first
+                continue
+        if first:
+            first = False
+        elif terminated and not cue_id_removed and line.isdecimal():
+            # cue id, the line ending it can not also start the next one
+            cue_id_removed = True
+            continue
+        else:
+            cue_id_removed = False
+            if line[:1].isdecimal():
+                write('\n' + str(index))
+                index += 1
+
+        if not terminated and not line:
+            break
+        parts = [line]
+        if LINE_BOUNDARIES.search(line):
+            parts = line.splitlines()
+            if terminated and LINE_BOUNDARIES.match(line[-1]) and line[-1] != '\r':
+                # only \r\n counts as one line end, any other pair ends an empty line as well
+                parts.append('')
+        for part in parts:
+            if part == 'putINDEXhere':
+                part = str(index)
+                index += 1
+            write('\n' + part)
 
 
 BLOCK_SIZE_BYTES = 16
@@ -485,16 +1166,96 @@ def aes_cbc_decrypt(data, key, iv):
     return decrypted_data
 
 
+@lru_cache(maxsize=1)
+def inverse_tables():
+    """
+    Inverse cipher T-tables, InvSubBytes and InvMixColumns of one byte as a 32-bit word
+    @returns {tuple}  Td0, Td1, Td2, Td3 (each 256 words)
+    """
+    td0 = []
+    for x in SBOX_INV:
+        td0.append((rijndael_mul(x, 0xE) << 24) | (rijndael_mul(x, 0x9) << 16) |
+                   (rijndael_mul(x, 0xD) << 8) | rijndael_mul(x, 0xB))
+    td1 = [((w >> 8) | (w << 24)) & 0xFFFFFFFF for w in td0]
+    td2 = [((w >> 8) | (w << 24)) & 0xFFFFFFFF for w in td1]
+    td3 = [((w >> 8) | (w << 24)) & 0xFFFFFFFF for w in td2]
+    return tuple(td0), tuple(td1), tuple(td2), tuple(td3)
+
+
+@lru_cache(maxsize=32)
+def decryption_key(key):
+    """
+    Round keys for the equivalent inverse cipher, last round first
+    @param {bytes} key   16/24/32-Byte cipher key
+    @returns {tuple}     round keys as 32-bit words
+    """
+    td0, td1, td2, td3 = inverse_tables()
+    expanded = bytes(key_expansion(list(key)))
+    words = struct.unpack('>%dI' % (len(expanded) // 4), expanded)
+    rounds = len(words) // 4 - 1
+
+    round_keys = []
+    for r in range(rounds, -1, -1):
+        for w in words[r * 4: r * 4 + 4]:
+            if 0 < r < rounds:
+                # InvMixColumns of the round key, Td(SBOX[x]) cancels the InvSubBytes part
+                w = (td0[SBOX[w >> 24]] ^ td1[SBOX[(w >> 16) & 0xFF]] ^
+                     td2[SBOX[(w >> 8) & 0xFF]] ^ td3[SBOX[w & 0xFF]])
+            round_keys.append(w)
+    return tuple(round_keys)
+
+
+def aes_cbc_decrypt_bytes(data, key, iv):
+    """
+    Decrypt with aes in CBC mode, table driven version of aes_cbc_decrypt
+    @param {bytes} data        cipher
+    @param {bytes} key         16/24/32-Byte cipher key
+    @param {bytes} iv          16-Byte IV
+    @returns {bytes}           decrypted data
+    """
+    td0, td1, td2, td3 = inverse_tables()
+    rk = decryption_key(bytes(key))
+    rounds = len(rk) // 4 - 1
+    length = len(data)
+    if length % BLOCK_SIZE_BYTES:
+        data = bytes(data) + bytes(BLOCK_SIZE_BYTES - length % BLOCK_SIZE_BYTES)
+
+    words = struct.unpack('>%dI' % (len(data) // 4), data)
+    p0, p1, p2, p3 = struct.unpack('>4I', iv)
+    out = bytearray(len(data))
+    for i in range(0, len(words), 4):
+        c0, c1, c2, c3 = words[i: i + 4]
+        s0, s1, s2, s3 = c0 ^ rk[0], c1 ^ rk[1], c2 ^ rk[2], c3 ^ rk[3]
+        for r in range(4, rounds * 4, 4):
+            s0, s1, s2, s3 = (
+                td0[s0 >> 24] ^ td1[(s3 >> 16) & 0xFF] ^ td2[(s2 >> 8) & 0xFF] ^ td3[s1 & 0xFF] ^ rk[r],
+                td0[s1 >> 24] ^ td1[(s0 >> 16) & 0xFF] ^ td2[(s3 >> 8) & 0xFF] ^ td3[s2 & 0xFF] ^ rk[r + 1],
+                td0[s2 >> 24] ^ td1[(s1 >> 16) & 0xFF] ^ td2[(s0 >> 8) & 0xFF] ^ td3[s3 & 0xFF] ^ rk[r + 2],
+                td0[s3 >> 24] ^ td1[(s2 >> 16) & 0xFF] ^ td2[(s1 >> 8) & 0xFF] ^ td3[s0 & 0xFF] ^ rk[r + 3])
+        # last round has no InvMixColumns
+        r = rounds * 4
+        struct.pack_into(
+            '>4I', out, i * 4,
+            ((SBOX_INV[s0 >> 24] << 24) | (SBOX_INV[(s3 >> 16) & 0xFF] << 16) |
+             (SBOX_INV[(s2 >> 8) & 0xFF] << 8) | SBOX_INV[s1 & 0xFF]) ^ rk[r] ^ p0,
+            ((SBOX_INV[s1 >> 24] << 24) | (SBOX_INV[(s0 >> 16) & 0xFF] << 16) |
+             (SBOX_INV[(s3 >> 8) & 0xFF] << 8) | SBOX_INV[s2 & 0xFF]) ^ rk[r + 1] ^ p1,
+            ((SBOX_INV[s2 >> 24] << 24) | (SBOX_INV[(s1 >> 16) & 0xFF] << 16) |
+             (SBOX_INV[(s0 >> 8) & 0xFF] << 8) | SBOX_INV[s3 & 0xFF]) ^ rk[r + 2] ^ p2,
+            ((SBOX_INV[s3 >> 24] << 24) | (SBOX_INV[(s2 >> 16) & 0xFF] << 16) |
+             (SBOX_INV[(s1 >> 8) & 0xFF] << 8) | SBOX_INV[s0 & 0xFF]) ^ rk[r + 3] ^ p3)
+        p0, p1, p2, p3 = c0, c1, c2, c3
+    return bytes(out[:length])
+
+
 def decrypt_uri(e):
     n = int(e[2:10], 16)
     a = e[10 + n:]
-    data = bytes_to_intlist(hex_to_bytes(e[10:10 + n]))
-    key = bytes_to_intlist(hashlib.sha256(
-        ('%s:sRBzYNXBzkKgnjj8pGtkACch' % a).encode('utf-8')).digest())
-    iv = bytes_to_intlist(hex_to_bytes(a))
-    decrypted = aes_cbc_decrypt(data, key, iv)
-    return intlist_to_bytes(
-        decrypted[:-decrypted[-1]]).decode('utf-8').split('?')[0]
+    data = hex_to_bytes(e[10:10 + n])
+    key = hashlib.sha256(('%s:sRBzYNXBzkKgnjj8pGtkACch' % a).encode('utf-8')).digest()
+    iv = hex_to_bytes(a)
+    decrypted = aes_cbc_decrypt_bytes(data, key, iv)
+    return decrypted[:-decrypted[-1]].decode('utf-8').split('?')[0]
 
 
 class ApiException(Exception):